@@ -11,11 +11,14 @@ if __name__ == "__main__":
     load_dotenv(Path.cwd() / ".env")
     logger.info(f"当前应用环境：{os.getenv('APP_ENV')}")
     log_level = os.getenv("LOG_LEVEL", "INFO").lower()
+    # 生产环境关闭热重载，多核部署通过 WEB_CONCURRENCY 控制 worker 数
+    is_prod = os.getenv("APP_ENV") == "prod"
 
     uvicorn.run(
         "src.server.main:app",
         host="0.0.0.0",
         port=int(os.getenv("PORT", 3000)),
-        reload=True,
+        reload=not is_prod,
+        workers=int(os.getenv("WEB_CONCURRENCY", 1)),
         log_level=log_level.lower(),
     )
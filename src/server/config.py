@@ -11,6 +11,7 @@
 说明：
 - 支持 .env 与 .env.{APP_ENV} 加载
 - 提供 CORS 允许源解析
+- `db_pool_*` 控制数据库连接池容量；`db_thread_workers` 控制同步 ORM 调用所用线程池的大小
 """
 
 import os
@@ -41,6 +42,22 @@ class GlobalConfig(BaseSettings):
         description="相对项目根目录的相对路径",
     )
 
+    db_pool_size: int = Field(default=20, ge=1, title="连接池常驻连接数")
+    db_max_overflow: int = Field(default=10, ge=0, title="连接池允许的溢出连接数")
+    db_pool_timeout: float = Field(default=30, gt=0, title="获取连接的超时秒数")
+    db_pool_recycle: int = Field(
+        default=1800,
+        title="连接回收秒数",
+        description="超过该时长的连接在取用前重建，-1 表示不回收",
+    )
+
+    db_thread_workers: int = Field(
+        default=16,
+        ge=1,
+        title="数据库线程池大小",
+        description="run_in_thread 使用的事件循环默认线程池线程数，建议不超过连接池容量",
+    )
+
     app_secret_key: str = Field(
         default="dev_secret_key_for_testing_only",
         title="应用密钥",
@@ -60,7 +60,7 @@ def test_db_engine() -> Iterator[Connection]:
 def test_db_session(test_db_engine) -> Iterator[Session]:
     """提供内存数据库会话。"""
     TestingSessionLocal = sessionmaker(
-        bind=test_db_engine, autocommit=False, autoflush=False
+        bind=test_db_engine, autocommit=False, autoflush=False, expire_on_commit=False
     )
     session = TestingSessionLocal()
     try:
@@ -88,7 +88,7 @@ def test_client(test_db_session: Session) -> Iterator[TestClient]:
 def init_test_database(test_db_engine) -> None:
     """初始化默认管理员等必要基础数据。"""
     TestingSessionLocal = sessionmaker(
-        bind=test_db_engine, autocommit=False, autoflush=False
+        bind=test_db_engine, autocommit=False, autoflush=False, expire_on_commit=False
     )
     session = TestingSessionLocal()
     try:
@@ -6,7 +6,8 @@
 - `Base`：SQLAlchemy 声明基类
 - `engine`：数据库引擎
 - `SessionLocal`：会话工厂
-- `get_db()`：FastAPI 依赖获取会话
+- `get_db()`：FastAPI 依赖获取会话（请求结束时统一提交）
+- `ping_database()`：执行 `SELECT 1` 检查数据库连通性
 - `init_database()`：创建所有表
 - `get_database_info()`：返回数据库文件信息
 
@@ -15,13 +16,16 @@
 
 说明：
 - 使用 SQLite，路由中通过 `asyncio.to_thread` 调用同步 ORM，避免阻塞事件循环。
+- JSON 列使用 orjson 编解码，替代标准库 json。
 """
 
 from __future__ import annotations
 
 import os
 from typing import Any, Iterator
-from sqlalchemy import create_engine
+
+import orjson
+from sqlalchemy import create_engine, text
 from sqlalchemy.orm import declarative_base, sessionmaker
 from pathlib import Path
 from loguru import logger
@@ -34,24 +38,55 @@ PROJECT_ROOT = Path.cwd()
 DATABASE_PATH = PROJECT_ROOT / global_config.database_path
 
 SQLALCHEMY_DATABASE_URL = f"{global_config.database_protocol}:///{DATABASE_PATH}"
+
+
+def _json_serializer(value: Any) -> str:
+    """JSON 列序列化（orjson 输出 bytes，驱动需要 str）"""
+    return orjson.dumps(value).decode()
+
+
+# 显式设定连接池容量，避免并发请求排队等待默认的 5 个连接；取用前 ping 以剔除失效连接
 engine = create_engine(
     SQLALCHEMY_DATABASE_URL,
     connect_args={"check_same_thread": False},  # SQLite 特有
     echo=False,
+    pool_size=global_config.db_pool_size,
+    max_overflow=global_config.db_max_overflow,
+    pool_timeout=global_config.db_pool_timeout,
+    pool_recycle=global_config.db_pool_recycle,
+    pool_pre_ping=True,
+    json_serializer=_json_serializer,
+    json_deserializer=orjson.loads,
 )
 
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# 提交后不过期实例，避免读取已提交对象时再发一次 SELECT
+SessionLocal = sessionmaker(
+    autocommit=False, autoflush=False, expire_on_commit=False, bind=engine
+)
 
 
 def get_db() -> Iterator:
-    """获取数据库会话（FastAPI 依赖）。"""
+    """获取数据库会话（FastAPI 依赖）。
+
+    请求级事务：处理成功后统一提交一次，出现异常则回滚。
+    """
     db = SessionLocal()
     try:
         yield db
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
     finally:
         db.close()
 
 
+def ping_database() -> None:
+    """执行 `SELECT 1` 检查数据库连通性（失败时抛出异常）"""
+    with engine.connect() as connection:
+        connection.execute(text("SELECT 1"))
+
+
 def init_database() -> None:
     """初始化数据库并创建所有表。"""
     DATABASE_PATH.parent.mkdir(parents=True, exist_ok=True)
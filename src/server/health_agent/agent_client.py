@@ -8,9 +8,16 @@
 公开接口：
     - `AgentClient`
     - `AgentClientError`
+    - `get_agent_client`
+    - `close_agent_client`
 
 内部方法：
     - `_normalize_list`
+    - `_get_shared_baml_client`
+    - `_SuggestionCache`
+    - `_suggestion_cache_key`
+    - `_build_baml_metric`
+    - `_build_baml_preference`
 
 公开接口的 pydantic 模型：
     - `AgentSuggestion`（来自 schemas，由本模块实例化）
@@ -18,13 +25,21 @@
 
 from __future__ import annotations
 
+import asyncio
+import re
+import time
+from collections import OrderedDict
 from dataclasses import dataclass
-from typing import AsyncIterator, Iterable, List
+from datetime import datetime
+from functools import lru_cache
+from typing import AsyncGenerator, Hashable, Iterable, List
 
 from baml_client.async_client import BamlAsyncClient
 from baml_client.runtime import DoNotUseDirectlyCallManager
-from baml_client import types
+from baml_client import stream_types, types
+from baml_client.tracing import flush as flush_baml_tracing
 
+from .config import health_agent_config
 from .schemas import (
     AgentContext,
     AgentChangeItem,
@@ -37,10 +52,145 @@ from .schemas import (
 )
 
 
+# 去除行首尾的空白与列表符号（- •）
+_BULLET_PATTERN = re.compile(r"^[\s\-•]+|[\s\-•]+$")
+_LINE_SPLIT_PATTERN = re.compile(r"[\r\n]+")
+
+
 class AgentClientError(RuntimeError):
     """LLM 客户端异常"""
 
 
+_shared_baml_client: BamlAsyncClient | None = None
+
+
+def _get_shared_baml_client() -> BamlAsyncClient:
+    """懒加载进程级共享的 BAML 客户端，复用底层运行时的连接池"""
+    global _shared_baml_client
+    if _shared_baml_client is None:
+        _shared_baml_client = BamlAsyncClient(DoNotUseDirectlyCallManager({}))
+    return _shared_baml_client
+
+
+class _SuggestionCache:
+    """进程内的 LRU + TTL 建议缓存（附带并发请求合并）"""
+
+    def __init__(self, max_entries: int, ttl_seconds: float):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: OrderedDict[Hashable, tuple[float, AgentSuggestion]] = (
+            OrderedDict()
+        )
+        # 进行中的 LLM 调用，用于合并相同上下文的并发请求
+        self.inflight: dict[Hashable, asyncio.Future[AgentSuggestion]] = {}
+
+    @property
+    def enabled(self) -> bool:
+        return self.ttl_seconds > 0 and self.max_entries > 0
+
+    def get(self, key: Hashable) -> AgentSuggestion | None:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, suggestion = entry
+        if expires_at <= time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return suggestion
+
+    def set(self, key: Hashable, suggestion: AgentSuggestion) -> None:
+        self._entries[key] = (time.monotonic() + self.ttl_seconds, suggestion)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def complete(self, key: Hashable, task: asyncio.Future) -> None:
+        """进行中的调用结束：移出 inflight，成功时写入缓存"""
+        self.inflight.pop(key, None)
+        if task.cancelled():
+            return
+        # 读取异常以标记已处理（等待者均已取消时避免 "exception was never retrieved"）
+        if task.exception() is None and self.enabled:
+            self.set(key, task.result())
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+
+_suggestion_cache = _SuggestionCache(
+    max_entries=health_agent_config.suggestion_cache_max_entries,
+    ttl_seconds=health_agent_config.suggestion_cache_ttl_seconds,
+)
+
+
+def _suggestion_cache_key(context: AgentContext) -> Hashable:
+    """按影响建议内容的字段构造缓存键（忽略 id 与记录时间，数值保留一位小数）"""
+    metric = context.metric
+    preference = context.preference
+    return (
+        round(metric.weight_kg, 1),
+        round(metric.body_fat_percent, 1),
+        round(metric.bmi, 1),
+        round(metric.muscle_percent, 1),
+        round(metric.water_percent, 1),
+        metric.note,
+        None
+        if preference is None
+        else (
+            preference.target_weight_kg,
+            preference.calorie_budget_kcal,
+            preference.dietary_preference,
+            preference.activity_level,
+            preference.sleep_goal_hours,
+            preference.hydration_goal_liters,
+        ),
+    )
+
+
+# 同一轮会话中体测与偏好通常不变，按全部字段值缓存转换结果，
+# 字段被修改后键随之变化，无需额外失效处理。
+# 输入均来自已校验的 Pydantic 模型，构造 BAML 类型时统一跳过校验。
+@lru_cache(maxsize=1024)
+def _build_baml_metric(
+    weight_kg: float,
+    body_fat_percent: float,
+    bmi: float,
+    muscle_percent: float,
+    water_percent: float,
+    recorded_at: datetime,
+    note: str | None,
+) -> types.HealthMetric:
+    return types.HealthMetric.model_construct(
+        weight_kg=weight_kg,
+        body_fat_percent=body_fat_percent,
+        bmi=bmi,
+        muscle_percent=muscle_percent,
+        water_percent=water_percent,
+        recorded_at=recorded_at.isoformat(),
+        note=note,
+    )
+
+
+@lru_cache(maxsize=1024)
+def _build_baml_preference(
+    target_weight_kg: float | None,
+    calorie_budget_kcal: int | None,
+    dietary_preference: str | None,
+    activity_level: str | None,
+    sleep_goal_hours: float | None,
+    hydration_goal_liters: float | None,
+) -> types.HealthPreference:
+    return types.HealthPreference.model_construct(
+        target_weight_kg=target_weight_kg,
+        calorie_budget_kcal=calorie_budget_kcal,
+        dietary_preference=dietary_preference,
+        activity_level=activity_level,
+        sleep_goal_hours=sleep_goal_hours,
+        hydration_goal_liters=hydration_goal_liters,
+    )
+
+
 class AgentClient:
     """通过 BAML 调用 LLM 的健康建议客户端"""
 
@@ -59,14 +209,16 @@ class AgentClient:
         "hydration_goal_liters",
     )
 
-    def __init__(self):
-        # 初始化 BAML 异步客户端（使用默认配置）
-        self.client = BamlAsyncClient(DoNotUseDirectlyCallManager({}))
+    def __init__(self, client: BamlAsyncClient | None = None) -> None:
+        # 默认复用共享的 BAML 异步客户端，避免每次实例化都重建调用管理器
+        self.client = client or _get_shared_baml_client()
 
     async def fetch_suggestion(self, context: AgentContext) -> AgentSuggestion:
         """
         调用 BAML 定义的 GenerateHealthSuggestion 函数获取建议
 
+        相同的指标与偏好在缓存有效期内直接返回上次结果，不再请求 LLM。
+
         Args:
             context: 包含健康指标与偏好的 AgentContext，需要转换为 BAML 类型
 
@@ -76,6 +228,24 @@ class AgentClient:
         Raises:
             AgentClientError: 当 LLM 调用失败时抛出
         """
+        cache_key = _suggestion_cache_key(context)
+        if _suggestion_cache.enabled:
+            cached = _suggestion_cache.get(cache_key)
+            if cached is not None:
+                return cached
+
+        # 相同上下文的并发请求共享同一次 LLM 调用；shield 保证某个请求被取消时不影响其余等待者
+        task = _suggestion_cache.inflight.get(cache_key)
+        if task is None:
+            task = asyncio.ensure_future(self._request_suggestion(context))
+            _suggestion_cache.inflight[cache_key] = task
+            task.add_done_callback(
+                lambda done: _suggestion_cache.complete(cache_key, done)
+            )
+        return await asyncio.shield(task)
+
+    async def _request_suggestion(self, context: AgentContext) -> AgentSuggestion:
+        """实际调用 GenerateHealthSuggestion 并规范化结果"""
         try:
             # 转换 Python 对象为 BAML 类型
             baml_metric = self._convert_to_baml_metric(context.metric)
@@ -84,7 +254,7 @@ class AgentClient:
                 if context.preference
                 else None
             )
-            baml_context = types.HealthAgentContext(
+            baml_context = types.HealthAgentContext.model_construct(
                 metric=baml_metric,
                 preference=baml_preference,
             )
@@ -92,8 +262,8 @@ class AgentClient:
             # 调用 BAML 函数
             result = await self.client.GenerateHealthSuggestion(baml_context)
 
-            # 转换 BAML 结果为 Pydantic 模型
-            return AgentSuggestion(
+            # BAML 已按 schema 解析并校验结果，字段经规范化后类型确定，跳过二次校验
+            return AgentSuggestion.model_construct(
                 summary=result.summary or "暂无摘要",
                 meal_plan=self._normalize_list(result.meal_plan),
                 calorie_management=self._normalize_list(result.calorie_management),
@@ -113,7 +283,7 @@ class AgentClient:
 
     async def stream_chat(
         self, request: AgentChatRequest
-    ) -> AsyncIterator["AgentClient.ChatStreamChunk"]:
+    ) -> AsyncGenerator["AgentClient.ChatStreamChunk", None]:
         """
         调用 StreamAgentChat 并以流式方式返回响应片段
         """
@@ -124,7 +294,7 @@ class AgentClient:
 
             async for partial in stream:
                 yield AgentClient.ChatStreamChunk(
-                    response=self._convert_chat_response(partial), is_final=False # type: ignore
+                    response=self._convert_partial_response(partial), is_final=False
                 )
 
             final = await stream.get_final_response()
@@ -136,14 +306,14 @@ class AgentClient:
 
     def _convert_to_baml_metric(self, metric: HealthMetricOut) -> types.HealthMetric:
         """将 HealthMetricOut 转换为 BAML 的 HealthMetric"""
-        return types.HealthMetric(
-            weight_kg=metric.weight_kg,
-            body_fat_percent=metric.body_fat_percent,
-            bmi=metric.bmi,
-            muscle_percent=metric.muscle_percent,
-            water_percent=metric.water_percent,
-            recorded_at=metric.recorded_at.isoformat(),
-            note=metric.note,
+        return _build_baml_metric(
+            metric.weight_kg,
+            metric.body_fat_percent,
+            metric.bmi,
+            metric.muscle_percent,
+            metric.water_percent,
+            metric.recorded_at,
+            metric.note,
         )
 
     def _convert_to_baml_preference(
@@ -154,40 +324,43 @@ class AgentClient:
         if preference is None:
             return None
 
-        return types.HealthPreference(
-            target_weight_kg=preference.target_weight_kg,
-            calorie_budget_kcal=preference.calorie_budget_kcal,
-            dietary_preference=preference.dietary_preference,
-            activity_level=preference.activity_level,
-            sleep_goal_hours=preference.sleep_goal_hours,
-            hydration_goal_liters=preference.hydration_goal_liters,
+        return _build_baml_preference(
+            preference.target_weight_kg,
+            preference.calorie_budget_kcal,
+            preference.dietary_preference,
+            preference.activity_level,
+            preference.sleep_goal_hours,
+            preference.hydration_goal_liters,
         )
 
-    def _normalize_list(self, value: Iterable[str] | str | None) -> List[str]:
+    @staticmethod
+    def _normalize_list(value: Iterable[str] | str | None) -> List[str]:
         """将字符串或可迭代对象转换为建议列表"""
-        if value is None:
+        if not value:
             return []
         if isinstance(value, str):
-            parts = [
-                item.strip("-• ").strip() for item in value.splitlines() if item.strip()
+            return [
+                part
+                for part in (
+                    _BULLET_PATTERN.sub("", line)
+                    for line in _LINE_SPLIT_PATTERN.split(value)
+                )
+                if part
             ]
-            return [part for part in parts if part]
-        result = []
-        for item in value:
-            text = str(item).strip()
-            if text:
-                result.append(text)
-        return result
+        return [text for text in map(str.strip, map(str, value)) if text]
 
+    @staticmethod
     def _convert_change_items(
-        self, items: List[AgentChangeItem] | None
+        items: List[AgentChangeItem] | None,
     ) -> List[types.AgentChangeItem]:
         """转换 change_log"""
         if not items:
             return []
 
         return [
-            types.AgentChangeItem(field=item.field, value=item.value, reason=item.reason)
+            types.AgentChangeItem.model_construct(
+                field=item.field, value=item.value, reason=item.reason
+            )
             for item in items
         ]
 
@@ -196,7 +369,7 @@ class AgentClient:
     ) -> List[types.AgentChatMessage]:
         """转换历史消息"""
         return [
-            types.AgentChatMessage(
+            types.AgentChatMessage.model_construct(
                 role=item.role,
                 content=item.content,
                 need_change=item.need_change,
@@ -209,7 +382,7 @@ class AgentClient:
         self, request: AgentChatRequest
     ) -> types.AgentChatRequest:
         """将 Pydantic 聊天请求转换为 BAML 类型"""
-        return types.AgentChatRequest(
+        return types.AgentChatRequest.model_construct(
             metric=self._convert_to_baml_metric(request.metric),
             preference=(
                 self._convert_to_baml_preference(request.preference)
@@ -220,12 +393,22 @@ class AgentClient:
             user_input=request.user_input,
         )
 
+    def _convert_partial_response(
+        self, partial: stream_types.AgentChatResponse
+    ) -> AgentChatResponse:
+        """转换流式中间片段：只透传文本，change_log 留到最终片段再清洗"""
+        return AgentChatResponse.model_construct(
+            content=partial.content or "",
+            need_change=bool(partial.need_change),
+            change_log=[],
+        )
+
     def _convert_chat_response(
         self, response: types.AgentChatResponse
     ) -> AgentChatResponse:
-        """将 BAML 响应转换成 Pydantic 模型"""
+        """将 BAML 响应转换成 Pydantic 模型（数据来自 BAML 解析结果，跳过二次校验）"""
         change_log = self.sanitize_change_items(response.change_log)
-        return AgentChatResponse(
+        return AgentChatResponse.model_construct(
             content=response.content or "",
             need_change=bool(response.need_change),
             change_log=change_log,
@@ -253,3 +436,26 @@ class AgentClient:
                 )
             )
         return sanitized
+
+
+_shared_agent_client: AgentClient | None = None
+
+
+def get_agent_client() -> AgentClient:
+    """返回进程级共享的 AgentClient，供服务层与依赖注入复用"""
+    global _shared_agent_client
+    if _shared_agent_client is None:
+        _shared_agent_client = AgentClient()
+    return _shared_agent_client
+
+
+def close_agent_client() -> None:
+    """应用关闭时调用：刷新 BAML 追踪缓冲并释放共享客户端与建议缓存
+
+    BAML 运行时自行管理底层 HTTP 连接池，进程内只需丢弃共享实例引用。
+    """
+    global _shared_agent_client, _shared_baml_client
+    flush_baml_tracing()
+    _shared_agent_client = None
+    _shared_baml_client = None
+    _suggestion_cache.clear()
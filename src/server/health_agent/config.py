@@ -28,6 +28,24 @@ class HealthAgentConfig(BaseSettings):
         title="OpenAI 模型名称",
         description="使用的模型名称，默认为 gpt-4o-mini",
     )
+    suggestion_cache_ttl_seconds: float = Field(
+        default=300,
+        ge=0,
+        title="建议缓存有效期（秒）",
+        description="相同健康指标与偏好的建议在有效期内直接复用，设为 0 关闭缓存",
+    )
+    suggestion_cache_max_entries: int = Field(
+        default=256,
+        ge=0,
+        title="建议缓存最大条目数",
+        description="超过上限时按最近最少使用淘汰，设为 0 关闭缓存",
+    )
+    stream_flush_interval_ms: float = Field(
+        default=25,
+        ge=0,
+        title="流式片段合并窗口（毫秒）",
+        description="窗口内的中间片段只发送最新一片，设为 0 则逐片发送",
+    )
 
 
 health_agent_config = HealthAgentConfig()
@@ -11,16 +11,28 @@
      - `get_latest_recommendation`
 
 内部方法：
-    - `_apply_preference_fields`
+    - `_clamp_limit`
+    - `_upsert_preference`
+    - `_assign_preference`
 
 公开接口的 pydantic 模型：
     - `HealthMetricPayload`、`HealthPreferencePayload`（由 schemas 提供，DAO 仅消费）
+
+说明：
+    - 所有列默认值均在 Python 侧生成，提交后实例状态已完整，无需 refresh 再查询一次。
+    - 写方法只 flush 不 commit，事务由请求级依赖 `get_db` 统一提交；
+      响应返回后仍需落库的场景（如 SSE 流式回写）显式调用 `commit`。
 """
 
 from __future__ import annotations
 
-from sqlalchemy import desc
-from sqlalchemy.orm import Session
+from datetime import datetime, timezone
+from typing import Any, Sequence
+
+from sqlalchemy import Row, RowMapping, desc, func, insert, select, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session, aliased
 
 from src.server.dao.dao_base import BaseDAO
 from .models import (
@@ -35,6 +47,31 @@ from .schemas import (
     HealthPreferencePayload,
 )
 
+# 体测读路径只需输出模型的列，直接以 Core 行返回，省去 ORM 实例化与属性插桩开销
+_METRIC_OUT_COLUMNS = (
+    HealthMetric.id,
+    HealthMetric.user_id,
+    HealthMetric.weight_kg,
+    HealthMetric.body_fat_percent,
+    HealthMetric.bmi,
+    HealthMetric.muscle_percent,
+    HealthMetric.water_percent,
+    HealthMetric.recorded_at,
+    HealthMetric.note,
+)
+_METRIC_OUT_KEYS = tuple(column.key for column in _METRIC_OUT_COLUMNS)
+
+# 列表查询单次返回的最大行数，防止无界扫描
+_MAX_LIST_LIMIT = 200
+
+# 支持 `INSERT ... ON CONFLICT DO UPDATE` 的方言，其余方言走先查后写
+_ON_CONFLICT_DIALECTS = frozenset({"postgresql", "sqlite"})
+
+
+def _clamp_limit(limit: int) -> int:
+    """将列表查询的 limit 限制在 [1, _MAX_LIST_LIMIT]"""
+    return min(max(limit, 1), _MAX_LIST_LIMIT)
+
 
 class HealthDataDAO(BaseDAO):
     """健康数据访问对象"""
@@ -42,70 +79,163 @@ class HealthDataDAO(BaseDAO):
     def __init__(self, db_session: Session):
         super().__init__(db_session)
 
-    def create_metric(self, user_id: int, payload: HealthMetricPayload) -> HealthMetric:
-        metric = HealthMetric(
-            user_id=user_id,
-            weight_kg=payload.weight_kg,
-            body_fat_percent=payload.body_fat_percent,
-            bmi=payload.bmi,
-            muscle_percent=payload.muscle_percent,
-            water_percent=payload.water_percent,
-            recorded_at=payload.recorded_at,
-            note=payload.note,
-        )
-        self.db_session.add(metric)
+    def commit(self) -> None:
+        """提交当前事务"""
         self.db_session.commit()
-        self.db_session.refresh(metric)
-        return metric
 
-    def get_latest_metric(self, user_id: int) -> HealthMetric | None:
-        return (
-            self.db_session.query(HealthMetric)
-            .filter(HealthMetric.user_id == user_id)
+    def rollback(self) -> None:
+        """回滚当前事务"""
+        self.db_session.rollback()
+
+    def create_metric(self, user_id: int, payload: HealthMetricPayload) -> HealthMetric:
+        """新增体测记录，`INSERT ... RETURNING` 一次往返拿到带主键与默认值的完整行"""
+        stmt = (
+            insert(HealthMetric)
+            .values(
+                user_id=user_id,
+                weight_kg=payload.weight_kg,
+                body_fat_percent=payload.body_fat_percent,
+                bmi=payload.bmi,
+                muscle_percent=payload.muscle_percent,
+                water_percent=payload.water_percent,
+                recorded_at=payload.recorded_at,
+                note=payload.note,
+            )
+            .returning(HealthMetric)
+        )
+        return self.db_session.scalars(stmt).one()
+
+    def get_latest_metric(self, user_id: int) -> RowMapping | None:
+        """获取最新体测记录（Core 查询，返回列映射，不构造 ORM 实例）"""
+        stmt = (
+            select(*_METRIC_OUT_COLUMNS)
+            .where(HealthMetric.user_id == user_id)
             .order_by(desc(HealthMetric.recorded_at), desc(HealthMetric.id))
-            .first()
+            .limit(1)
         )
+        return self.db_session.execute(stmt).mappings().first()
 
-    def list_metrics(self, user_id: int, limit: int = 30) -> list[HealthMetric]:
-        query = (
-            self.db_session.query(HealthMetric)
-            .filter(HealthMetric.user_id == user_id)
+    def get_latest_metric_with_preference(
+        self, user_id: int
+    ) -> tuple[dict[str, Any] | None, HealthPreference | None]:
+        """一次查询取回最新体测（列映射）与用户偏好（ORM 实例）
+
+        `LEFT JOIN health_preferences`，无偏好时第二项为 None；无体测时两项均为 None。
+        """
+        stmt = (
+            select(*_METRIC_OUT_COLUMNS, HealthPreference)
+            .outerjoin(
+                HealthPreference, HealthPreference.user_id == HealthMetric.user_id
+            )
+            .where(HealthMetric.user_id == user_id)
             .order_by(desc(HealthMetric.recorded_at), desc(HealthMetric.id))
+            .limit(1)
         )
-        if limit > 0:
-            query = query.limit(limit)
-        return list(query.all())
+        row = self.db_session.execute(stmt).first()
+        if row is None:
+            return None, None
+        *metric_values, preference = row
+        return dict(zip(_METRIC_OUT_KEYS, metric_values)), preference
 
-    def get_preferences(self, user_id: int) -> HealthPreference | None:
-        return (
-            self.db_session.query(HealthPreference)
-            .filter(HealthPreference.user_id == user_id)
-            .first()
+    def list_metrics(self, user_id: int, limit: int = 30) -> Sequence[RowMapping]:
+        """按时间倒序获取体测记录（Core 查询，返回列映射）
+
+        limit 会被限制在 1~200 之间。
+        """
+        stmt = (
+            select(*_METRIC_OUT_COLUMNS)
+            .where(HealthMetric.user_id == user_id)
+            .order_by(desc(HealthMetric.recorded_at), desc(HealthMetric.id))
+            .limit(_clamp_limit(limit))
+        )
+        return self.db_session.execute(stmt).mappings().all()
+
+    def list_latest_metrics(self, user_ids: Sequence[int]) -> dict[int, HealthMetric]:
+        """批量获取多个用户各自最新的体测记录（单条 SQL，按 user_id 返回映射）
+
+        以窗口函数 `ROW_NUMBER() OVER (PARTITION BY user_id ...)` 取每个用户的第一行，
+        SQLite 与 PostgreSQL 均适用。
+        """
+        if not user_ids:
+            return {}
+        ranked = (
+            select(
+                HealthMetric.id,
+                func.row_number()
+                .over(
+                    partition_by=HealthMetric.user_id,
+                    order_by=(desc(HealthMetric.recorded_at), desc(HealthMetric.id)),
+                )
+                .label("rn"),
+            )
+            .where(HealthMetric.user_id.in_(user_ids))
+            .subquery()
         )
+        stmt = (
+            select(HealthMetric)
+            .join(ranked, HealthMetric.id == ranked.c.id)
+            .where(ranked.c.rn == 1)
+        )
+        return {metric.user_id: metric for metric in self.db_session.scalars(stmt)}
+
+    def get_preferences(self, user_id: int) -> HealthPreference | None:
+        """按 user_id 获取偏好，已加载到会话中的实例不再发起查询"""
+        return self.db_session.get(HealthPreference, user_id)
+
+    def list_preferences(self, user_ids: Sequence[int]) -> dict[int, HealthPreference]:
+        """批量获取多个用户的偏好（`WHERE user_id IN (...)`）"""
+        if not user_ids:
+            return {}
+        stmt = select(HealthPreference).where(HealthPreference.user_id.in_(user_ids))
+        return {pref.user_id: pref for pref in self.db_session.scalars(stmt)}
 
     def upsert_preferences(
         self, user_id: int, payload: HealthPreferencePayload
     ) -> HealthPreference:
+        """整体覆盖用户偏好（PUT 语义，未提供的字段写为空）"""
+        return self._upsert_preference(user_id, payload.model_dump())
+
+    def _upsert_preference(
+        self, user_id: int, values: dict[str, float | str | int | None]
+    ) -> HealthPreference:
+        """以单条 `INSERT ... ON CONFLICT (user_id) DO UPDATE ... RETURNING` 写入偏好
+
+        无需先查询再分支插入/更新，并发写入同一用户时也不会触发唯一约束冲突；
+        不支持 ON CONFLICT 的方言回退到 `_assign_preference`。
+        """
+        dialect = self.db_session.get_bind().dialect.name
+        if dialect not in _ON_CONFLICT_DIALECTS:
+            return self._assign_preference(user_id, values)
+
+        now = datetime.now(timezone.utc)
+        dialect_insert = pg_insert if dialect == "postgresql" else sqlite_insert
+        stmt = (
+            dialect_insert(HealthPreference)
+            .values(user_id=user_id, updated_at=now, **values)
+            .on_conflict_do_update(
+                index_elements=[HealthPreference.user_id],
+                set_={**values, "updated_at": now},
+            )
+            .returning(HealthPreference)
+        )
+        return self.db_session.scalars(
+            stmt, execution_options={"populate_existing": True}
+        ).one()
+
+    def _assign_preference(
+        self, user_id: int, values: dict[str, float | str | int | None]
+    ) -> HealthPreference:
+        """不支持 ON CONFLICT 的方言：先按主键读取，再新增或逐字段赋值"""
         preference = self.get_preferences(user_id)
         if preference is None:
             preference = HealthPreference(user_id=user_id)
             self.db_session.add(preference)
 
-        self._apply_preference_fields(preference, payload)
-        self.db_session.commit()
-        self.db_session.refresh(preference)
-        return preference
+        for field, value in values.items():
+            setattr(preference, field, value)
 
-    def _apply_preference_fields(
-        self, preference: HealthPreference, payload: HealthPreferencePayload
-    ) -> None:
-        """将 Pydantic payload 字段同步到模型实例"""
-        preference.target_weight_kg = payload.target_weight_kg
-        preference.calorie_budget_kcal = payload.calorie_budget_kcal
-        preference.dietary_preference = payload.dietary_preference
-        preference.activity_level = payload.activity_level
-        preference.sleep_goal_hours = payload.sleep_goal_hours
-        preference.hydration_goal_liters = payload.hydration_goal_liters
+        self.db_session.flush()
+        return preference
 
     def create_recommendation(
         self, user_id: int, suggestion: AgentSuggestion
@@ -121,8 +251,7 @@ class HealthDataDAO(BaseDAO):
             lifestyle=suggestion.lifestyle,
         )
         self.db_session.add(recommendation)
-        self.db_session.commit()
-        self.db_session.refresh(recommendation)
+        self.db_session.flush()
         return recommendation
 
     def get_latest_recommendation(self, user_id: int) -> HealthRecommendation | None:
@@ -139,7 +268,10 @@ class HealthDataDAO(BaseDAO):
     def list_assistant_messages(
         self, user_id: int, limit: int = 50
     ) -> list[HealthAssistantMessage]:
-        """返回按时间排序的助手对话历史（最旧在前）"""
+        """返回按时间排序的助手对话历史（最旧在前）
+
+        子查询按倒序取最近 N 条（N 限制在 1~200 之间），外层在 SQL 中重新正序排列。
+        """
         query = (
             self.db_session.query(HealthAssistantMessage)
             .filter(HealthAssistantMessage.user_id == user_id)
@@ -148,11 +280,37 @@ class HealthDataDAO(BaseDAO):
                 desc(HealthAssistantMessage.id),
             )
         )
-        if limit > 0:
-            query = query.limit(limit)
-        records = list(query.all())
-        records.reverse()
-        return records
+        query = query.limit(_clamp_limit(limit))
+        recent = aliased(HealthAssistantMessage, query.subquery())
+        return (
+            self.db_session.query(recent)
+            .order_by(recent.created_at.asc(), recent.id.asc())
+            .all()
+        )
+
+    def list_chat_history_rows(self, user_id: int, limit: int = 50) -> list[Row]:
+        """返回构造对话上下文所需的列（最旧在前），不构造 ORM 实例"""
+        recent = (
+            select(
+                HealthAssistantMessage.id,
+                HealthAssistantMessage.role,
+                HealthAssistantMessage.content,
+                HealthAssistantMessage.need_change,
+                HealthAssistantMessage.change_log,
+                HealthAssistantMessage.created_at,
+            )
+            .where(HealthAssistantMessage.user_id == user_id)
+            .order_by(
+                desc(HealthAssistantMessage.created_at),
+                desc(HealthAssistantMessage.id),
+            )
+            .limit(_clamp_limit(limit))
+            .subquery()
+        )
+        stmt = select(
+            recent.c.role, recent.c.content, recent.c.need_change, recent.c.change_log
+        ).order_by(recent.c.created_at.asc(), recent.c.id.asc())
+        return list(self.db_session.execute(stmt))
 
     def create_assistant_message(
         self,
@@ -161,49 +319,74 @@ class HealthDataDAO(BaseDAO):
         content: str,
         *,
         need_change: bool = False,
-        change_log: list[dict] | None = None,
+        change_log: bytes | list[dict] | None = None,
     ) -> HealthAssistantMessage:
-        """保存一条助手对话消息"""
-        message = HealthAssistantMessage(
-            user_id=user_id,
-            role=role,
-            content=content,
-            need_change=need_change,
-            change_log=change_log or [],
+        """保存一条助手对话消息
+
+        change_log 可传入已编码的 JSON bytes 直接落库；`INSERT ... RETURNING` 取回的实例
+        中 change_log 为解码后的列表。
+        """
+        stmt = (
+            insert(HealthAssistantMessage)
+            .values(
+                user_id=user_id,
+                role=role,
+                content=content,
+                need_change=need_change,
+                change_log=change_log or [],
+            )
+            .returning(HealthAssistantMessage)
         )
-        self.db_session.add(message)
-        self.db_session.commit()
-        self.db_session.refresh(message)
-        return message
+        return self.db_session.scalars(stmt).one()
 
     def update_latest_metric_fields(
         self, user_id: int, updates: dict[str, float | str | int]
     ) -> HealthMetric:
-        """更新最新一条体测记录的部分字段"""
-        metric = self.get_latest_metric(user_id)
+        """更新最新一条体测记录的部分字段
+
+        以 `UPDATE ... WHERE id = (最新记录子查询) RETURNING` 一条语句完成定位与更新。
+        """
+        latest_id = (
+            select(HealthMetric.id)
+            .where(HealthMetric.user_id == user_id)
+            .order_by(desc(HealthMetric.recorded_at), desc(HealthMetric.id))
+            .limit(1)
+            .scalar_subquery()
+        )
+        stmt = (
+            update(HealthMetric)
+            .where(HealthMetric.id == latest_id)
+            .values(**updates)
+            .returning(HealthMetric)
+            .execution_options(synchronize_session="fetch", populate_existing=True)
+        )
+        metric = self.db_session.scalars(stmt).one_or_none()
         if metric is None:
             raise ValueError("用户暂无体测记录")
 
-        for field, value in updates.items():
-            setattr(metric, field, value)
+        self.db_session.flush()
+        return metric
 
-        self.db_session.add(metric)
-        self.db_session.commit()
-        self.db_session.refresh(metric)
+    def update_metric_fields(
+        self, user_id: int, metric_id: int, updates: dict[str, float | str | int]
+    ) -> HealthMetric:
+        """按 id 更新指定体测记录的部分字段（限定 user_id，`UPDATE ... RETURNING`）"""
+        stmt = (
+            update(HealthMetric)
+            .where(HealthMetric.id == metric_id, HealthMetric.user_id == user_id)
+            .values(**updates)
+            .returning(HealthMetric)
+            .execution_options(synchronize_session="fetch", populate_existing=True)
+        )
+        metric = self.db_session.scalars(stmt).one_or_none()
+        if metric is None:
+            raise ValueError("体测记录不存在")
+
+        self.db_session.flush()
         return metric
 
     def apply_preference_updates(
         self, user_id: int, updates: dict[str, float | str | int | None]
     ) -> HealthPreference:
         """对健康偏好进行局部更新（若不存在则创建）"""
-        preference = self.get_preferences(user_id)
-        if preference is None:
-            preference = HealthPreference(user_id=user_id)
-            self.db_session.add(preference)
-
-        for field, value in updates.items():
-            setattr(preference, field, value)
-
-        self.db_session.commit()
-        self.db_session.refresh(preference)
-        return preference
+        return self._upsert_preference(user_id, updates)
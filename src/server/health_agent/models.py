@@ -11,7 +11,8 @@
      - `HealthRecommendation`：记录 AI 生成的健康建议
 
 内部方法：
-    - 无
+    - `_utcnow`
+    - `_PreEncodedJSON`
 
 公开接口的 pydantic 模型：
     - 无（由本模块的 schemas 单独定义并在 service/路由层使用）
@@ -19,6 +20,7 @@
 设计说明：
     - user_id 为普通整型字段，不建立数据库外键，遵循项目在 service 层处理跨表关联的规范。
     - recorded_at 与 updated_at 统一使用 UTC，方便在前端进行本地化。
+    - user_id 不再单独建索引：各表的复合索引 / 唯一约束均以 user_id 为最左列，已覆盖按用户查询。
 """
 
 from __future__ import annotations
@@ -35,22 +37,42 @@ from sqlalchemy import (
     UniqueConstraint,
     Index,
     JSON,
+    TypeDecorator,
 )
 from sqlalchemy.orm import Mapped, mapped_column
 
 from src.server.database import Base
 
 
+def _utcnow() -> datetime:
+    """时间列默认值：当前 UTC 时间"""
+    return datetime.now(timezone.utc)
+
+
+class _PreEncodedJSON(TypeDecorator):
+    """JSON 列：绑定值为已编码的 JSON bytes 时原样写入，其余值仍走引擎的 JSON 序列化"""
+
+    impl = JSON
+    cache_ok = True
+
+    def bind_processor(self, dialect):
+        json_processor = self.impl_instance.bind_processor(dialect)
+
+        def process(value):
+            if isinstance(value, bytes):
+                return value.decode()
+            return json_processor(value) if json_processor else value
+
+        return process
+
+
 class HealthMetric(Base):
     """用户健康指标记录"""
 
     __tablename__ = "health_metrics"
-    __table_args__ = (
-        Index("idx_health_metrics_user_recorded", "user_id", "recorded_at"),
-    )
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
-    user_id: Mapped[int] = mapped_column(Integer, nullable=False, index=True)
+    user_id: Mapped[int] = mapped_column(Integer, nullable=False)
     weight_kg: Mapped[float] = mapped_column(Float, nullable=False)
     body_fat_percent: Mapped[float] = mapped_column(Float, nullable=False)
     bmi: Mapped[float] = mapped_column(Float, nullable=False)
@@ -59,13 +81,13 @@ class HealthMetric(Base):
     recorded_at: Mapped[datetime] = mapped_column(
         DateTime(timezone=True),
         nullable=False,
-        default=lambda: datetime.now(timezone.utc),
+        default=_utcnow,
     )
     note: Mapped[str | None] = mapped_column(Text, nullable=True)
     created_at: Mapped[datetime] = mapped_column(
         DateTime(timezone=True),
         nullable=False,
-        default=lambda: datetime.now(timezone.utc),
+        default=_utcnow,
     )
 
 
@@ -76,7 +98,7 @@ class HealthPreference(Base):
     __table_args__ = (UniqueConstraint("user_id", name="uq_health_preferences_user"),)
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
-    user_id: Mapped[int] = mapped_column(Integer, nullable=False, index=True)
+    user_id: Mapped[int] = mapped_column(Integer, nullable=False)
     target_weight_kg: Mapped[float | None] = mapped_column(Float, nullable=True)
     calorie_budget_kcal: Mapped[int | None] = mapped_column(Integer, nullable=True)
     dietary_preference: Mapped[str | None] = mapped_column(String(80), nullable=True)
@@ -86,21 +108,22 @@ class HealthPreference(Base):
     updated_at: Mapped[datetime] = mapped_column(
         DateTime(timezone=True),
         nullable=False,
-        default=lambda: datetime.now(timezone.utc),
-        onupdate=lambda: datetime.now(timezone.utc),
+        default=_utcnow,
+        onupdate=_utcnow,
     )
 
+    # 每个用户至多一条偏好（uq_health_preferences_user），以 user_id 作为 ORM 主键，
+    # 使 Session.get(HealthPreference, user_id) 可直接命中会话标识映射
+    __mapper_args__ = {"primary_key": [user_id]}
+
 
 class HealthRecommendation(Base):
     """用户健康建议记录"""
 
     __tablename__ = "health_recommendations"
-    __table_args__ = (
-        Index("idx_health_recommendations_user_created", "user_id", "created_at"),
-    )
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
-    user_id: Mapped[int] = mapped_column(Integer, nullable=False, index=True)
+    user_id: Mapped[int] = mapped_column(Integer, nullable=False)
     summary: Mapped[str] = mapped_column(Text, nullable=False)
     meal_plan: Mapped[list[str]] = mapped_column(JSON, nullable=False, default=list)
     calorie_management: Mapped[list[str]] = mapped_column(
@@ -114,7 +137,7 @@ class HealthRecommendation(Base):
     created_at: Mapped[datetime] = mapped_column(
         DateTime(timezone=True),
         nullable=False,
-        default=lambda: datetime.now(timezone.utc),
+        default=_utcnow,
     )
 
 
@@ -122,18 +145,48 @@ class HealthAssistantMessage(Base):
     """AI 助手对话消息记录"""
 
     __tablename__ = "health_assistant_messages"
-    __table_args__ = (
-        Index("idx_health_assistant_messages_user_created", "user_id", "created_at"),
-    )
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
-    user_id: Mapped[int] = mapped_column(Integer, index=True, nullable=False)
+    user_id: Mapped[int] = mapped_column(Integer, nullable=False)
     role: Mapped[str] = mapped_column(String(20), nullable=False)  # user / assistant
     content: Mapped[str] = mapped_column(Text, nullable=False)
     need_change: Mapped[bool] = mapped_column(Boolean, nullable=False, default=False)
-    change_log: Mapped[list[dict] | None] = mapped_column(JSON, nullable=True)
+    # 写入时接收 pydantic 直接产出的 JSON bytes，省去中间的 list[dict]
+    change_log: Mapped[list[dict] | None] = mapped_column(
+        _PreEncodedJSON, nullable=True
+    )
     created_at: Mapped[datetime] = mapped_column(
         DateTime(timezone=True),
         nullable=False,
-        default=lambda: datetime.now(timezone.utc),
+        default=_utcnow,
     )
+
+
+# 以下复合索引与 DAO 中 "按用户过滤 + 时间/ID 倒序 + LIMIT" 的查询方向一致，
+# 使最新记录查询退化为一次索引范围扫描，无需额外排序；
+# PostgreSQL 下指标索引额外 INCLUDE 数值列，读取指标时可走 index-only scan（SQLite 忽略该参数）
+Index(
+    "idx_health_metrics_user_recorded_id",
+    HealthMetric.user_id,
+    HealthMetric.recorded_at.desc(),
+    HealthMetric.id.desc(),
+    postgresql_include=[
+        "weight_kg",
+        "body_fat_percent",
+        "bmi",
+        "muscle_percent",
+        "water_percent",
+    ],
+)
+Index(
+    "idx_health_recommendations_user_created_id",
+    HealthRecommendation.user_id,
+    HealthRecommendation.created_at.desc(),
+    HealthRecommendation.id.desc(),
+)
+Index(
+    "idx_health_assistant_messages_user_created_id",
+    HealthAssistantMessage.user_id,
+    HealthAssistantMessage.created_at.desc(),
+    HealthAssistantMessage.id.desc(),
+)
@@ -17,7 +17,8 @@
      - POST /api/health/assistant/chat/stream
 
 内部方法：
-    - 无
+    - `_etag_response`
+    - `_format_sse`
 
 公开接口的 pydantic 模型：
      - `HealthMetricPayload`
@@ -30,33 +31,41 @@
 
 from __future__ import annotations
 
-import json
+import hashlib
 
-from fastapi import APIRouter, Depends, HTTPException, status
-from fastapi.responses import StreamingResponse
-from sqlalchemy.orm import Session
+import orjson
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, status
+from fastapi.responses import ORJSONResponse, Response, StreamingResponse
+from pydantic import BaseModel
 
 from src.server.auth.dependencies import get_current_user
 from src.server.auth.models import User
 from src.server.dao.dao_base import run_in_thread
-from src.server.database import get_db
 from .agent_client import AgentClientError
 from .schemas import (
     AgentContext,
     AgentSuggestion,
-    AgentChatMessage,
+    AssistantMessageListAdapter,
     AssistantMessageOut,
     AssistantMessagePayload,
     AssistantStreamChunk,
+    HealthMetricListAdapter,
     HealthMetricOut,
     HealthMetricPayload,
     HealthPreferenceOut,
     HealthPreferencePayload,
     HealthRecommendationOut,
 )
-from .service import HealthService
+from .service import HealthService, get_health_service
 
-router = APIRouter(prefix="/api/health", tags=["健康管理"])
+# 默认以 orjson 编码 JSON 响应，替代 Starlette 基于标准库 json 的 JSONResponse
+router = APIRouter(
+    prefix="/api/health", tags=["健康管理"], default_response_class=ORJSONResponse
+)
+
+# 中间片段帧的固定尾部
+_SSE_NEED_CHANGE_TAIL = b',"need_change":true,"change_log":[],"is_final":false}\n\n'
+_SSE_NO_CHANGE_TAIL = b',"need_change":false,"change_log":[],"is_final":false}\n\n'
 
 
 @router.post(
@@ -67,11 +76,9 @@ router = APIRouter(prefix="/api/health", tags=["健康管理"])
 )
 async def create_metric(
     payload: HealthMetricPayload,
-    db: Session = Depends(get_db),
+    service: HealthService = Depends(get_health_service),
     current_user: User = Depends(get_current_user),
 ) -> HealthMetricOut:
-    service = HealthService(db)
-
     def _create() -> HealthMetricOut:
         return service.record_metric(current_user.id, payload)
 
@@ -84,11 +91,10 @@ async def create_metric(
     summary="获取最新健康指标",
 )
 async def get_latest_metric(
-    db: Session = Depends(get_db),
+    request: Request,
+    service: HealthService = Depends(get_health_service),
     current_user: User = Depends(get_current_user),
-) -> HealthMetricOut:
-    service = HealthService(db)
-
+) -> Response:
     def _fetch() -> HealthMetricOut | None:
         return service.get_latest_metric(current_user.id)
 
@@ -97,7 +103,7 @@ async def get_latest_metric(
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND, detail="尚无健康指标记录。"
         )
-    return metric
+    return _etag_response(request, metric)
 
 
 @router.get(
@@ -106,16 +112,19 @@ async def get_latest_metric(
     summary="分页获取历史健康指标",
 )
 async def get_metric_history(
-    limit: int = 30,
-    db: Session = Depends(get_db),
+    limit: int = Query(30, ge=1, le=200, description="返回条数"),
+    service: HealthService = Depends(get_health_service),
     current_user: User = Depends(get_current_user),
-) -> list[HealthMetricOut]:
-    service = HealthService(db)
-
+) -> Response:
     def _fetch() -> list[HealthMetricOut]:
         return service.list_metrics(current_user.id, limit=limit)
 
-    return await run_in_thread(_fetch)
+    metrics = await run_in_thread(_fetch)
+    # 列表直接整体序列化为 JSON 字节，跳过 FastAPI 对 response_model 的逐项再校验
+    return Response(
+        content=HealthMetricListAdapter.dump_json(metrics),
+        media_type="application/json",
+    )
 
 
 @router.get(
@@ -124,17 +133,16 @@ async def get_metric_history(
     summary="获取个人健康偏好",
 )
 async def get_preferences(
-    db: Session = Depends(get_db),
+    request: Request,
+    service: HealthService = Depends(get_health_service),
     current_user: User = Depends(get_current_user),
-) -> HealthPreferenceOut:
-    service = HealthService(db)
-
+) -> Response:
     def _fetch() -> HealthPreferenceOut | None:
         return service.get_preferences(current_user.id)
 
     preference = await run_in_thread(_fetch)
     if preference is None:
-        return HealthPreferenceOut(
+        preference = HealthPreferenceOut(
             user_id=current_user.id,
             target_weight_kg=None,
             calorie_budget_kcal=None,
@@ -143,7 +151,7 @@ async def get_preferences(
             sleep_goal_hours=None,
             hydration_goal_liters=None,
         )
-    return preference
+    return _etag_response(request, preference)
 
 
 @router.put(
@@ -153,11 +161,9 @@ async def get_preferences(
 )
 async def update_preferences(
     payload: HealthPreferencePayload,
-    db: Session = Depends(get_db),
+    service: HealthService = Depends(get_health_service),
     current_user: User = Depends(get_current_user),
 ) -> HealthPreferenceOut:
-    service = HealthService(db)
-
     def _update() -> HealthPreferenceOut:
         return service.update_preferences(current_user.id, payload)
 
@@ -170,11 +176,9 @@ async def update_preferences(
     summary="生成 AI 健康建议",
 )
 async def generate_recommendations(
-    db: Session = Depends(get_db),
+    service: HealthService = Depends(get_health_service),
     current_user: User = Depends(get_current_user),
 ) -> AgentSuggestion:
-    service = HealthService(db)
-
     def _build() -> AgentContext:
         return service.build_agent_context(current_user.id)
 
@@ -188,11 +192,9 @@ async def generate_recommendations(
     summary="获取最新健康建议",
 )
 async def get_latest_recommendation(
-    db: Session = Depends(get_db),
+    service: HealthService = Depends(get_health_service),
     current_user: User = Depends(get_current_user),
 ) -> HealthRecommendationOut:
-    service = HealthService(db)
-
     def _fetch() -> HealthRecommendationOut | None:
         return service.get_latest_recommendation(current_user.id)
 
@@ -210,16 +212,18 @@ async def get_latest_recommendation(
     summary="获取 AI 助手历史消息",
 )
 async def list_assistant_messages(
-    limit: int = 50,
-    db: Session = Depends(get_db),
+    limit: int = Query(50, ge=1, le=200, description="返回条数"),
+    service: HealthService = Depends(get_health_service),
     current_user: User = Depends(get_current_user),
-) -> list[AssistantMessageOut]:
-    service = HealthService(db)
-
+) -> Response:
     def _fetch() -> list[AssistantMessageOut]:
         return service.list_assistant_messages(current_user.id, limit=limit)
 
-    return await run_in_thread(_fetch)
+    messages = await run_in_thread(_fetch)
+    return Response(
+        content=AssistantMessageListAdapter.dump_json(messages),
+        media_type="application/json",
+    )
 
 
 @router.post(
@@ -229,26 +233,12 @@ async def list_assistant_messages(
 )
 async def stream_assistant_chat(
     payload: AssistantMessagePayload,
-    db: Session = Depends(get_db),
+    service: HealthService = Depends(get_health_service),
     current_user: User = Depends(get_current_user),
 ) -> StreamingResponse:
-    service = HealthService(db)
     user_id = current_user.id
-
-    def _build_context() -> AgentContext:
-        return service.build_agent_context(user_id)
-
-    def _build_history() -> list[AgentChatMessage]:
-        return service.build_chat_history(user_id, limit=50)
-
-    context = await run_in_thread(_build_context)
-    history = await run_in_thread(_build_history)
-    request = service.compose_chat_request(context, history, payload.content)
-
-    await run_in_thread(
-        lambda: service.save_assistant_message(
-            user_id, "user", request.user_input
-        )
+    request = await run_in_thread(
+        lambda: service.prepare_stream_chat(user_id, payload.content)
     )
 
     async def event_generator():
@@ -256,21 +246,10 @@ async def stream_assistant_chat(
             async for chunk in service.stream_chat(request):
                 yield _format_sse(chunk)
                 if chunk.is_final:
+                    # 依赖 get_db 已在响应开始前完成提交，流式阶段的写入在此单独提交
                     await run_in_thread(
-                        lambda: service.save_assistant_message(
-                            user_id,
-                            "assistant",
-                            chunk.content,
-                            need_change=chunk.need_change,
-                            change_log=chunk.change_log,
-                        )
+                        lambda: service.finalize_assistant_turn(user_id, chunk)
                     )
-                    if chunk.need_change and chunk.change_log:
-                        await run_in_thread(
-                            lambda: service.apply_change_log(
-                                user_id, chunk.change_log
-                            )
-                        )
         except AgentClientError as exc:
             error_chunk = AssistantStreamChunk(
                 content=f"AI 助手暂时不可用：{exc}",
@@ -287,6 +266,32 @@ async def stream_assistant_chat(
     )
 
 
-def _format_sse(chunk: AssistantStreamChunk) -> str:
-    payload = json.dumps(chunk.model_dump(mode="json"), ensure_ascii=False)
-    return f"data: {payload}\n\n"
+def _etag_response(request: Request, model: BaseModel) -> Response:
+    """以响应体摘要作为弱 ETag 返回 JSON；与 If-None-Match 匹配时返回无响应体的 304
+
+    ETag 取自内容而非 id/时间戳：AI change_log 会原地修改最新体测，id 与 recorded_at 不变。
+    """
+    body = model.__pydantic_serializer__.to_json(model)
+    etag = f'W/"{hashlib.blake2b(body, digest_size=12).hexdigest()}"'
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and any(
+        tag.strip() in (etag, "*") for tag in if_none_match.split(",")
+    ):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
+
+
+def _format_sse(chunk: AssistantStreamChunk) -> bytes:
+    """编码一帧 SSE，直接产出 bytes，StreamingResponse 无需再逐帧 encode"""
+    if not chunk.is_final and not chunk.change_log:
+        # 逐 token 的中间片段只有文本在变化，直接拼接帧，仅对 content 做一次 JSON 编码
+        return b"".join(
+            (
+                b'data: {"content":',
+                orjson.dumps(chunk.content),
+                _SSE_NEED_CHANGE_TAIL if chunk.need_change else _SSE_NO_CHANGE_TAIL,
+            )
+        )
+    # 直接取 pydantic-core 序列化出的 UTF-8 bytes（不转义中文），省去 model_dump_json 的 str 往返
+    return b"data: " + chunk.__pydantic_serializer__.to_json(chunk) + b"\n\n"
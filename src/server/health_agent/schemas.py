@@ -20,9 +20,16 @@
      - `AssistantMessagePayload`
      - `AssistantMessageOut`
      - `AssistantStreamChunk`
+     - `HealthMetricListAdapter`
+     - `AssistantMessageListAdapter`
+     - `AgentChangeItemListAdapter`
+     - `METRIC_RATIO_ERROR_TYPE`
 
 内部方法：
+    - `_utcnow`
     - `_ensure_timezone`
+    - `_orm_attributes`
+    - `_TrustedOrmModel`
 
 公开接口的 pydantic 模型：
     - 本文件所有模型即为公开接口。
@@ -30,19 +37,64 @@
 
 from __future__ import annotations
 
-from datetime import datetime, timezone
-from typing import List, Literal, Optional
+from datetime import datetime, timedelta, timezone
+from typing import Any, List, Literal, Optional, TypeVar
 
-from pydantic import BaseModel, ConfigDict, Field, field_validator
+from pydantic import (
+    BaseModel,
+    ConfigDict,
+    Field,
+    TypeAdapter,
+    field_validator,
+    model_validator,
+)
+from pydantic_core import PydanticCustomError
+
+_ZERO_OFFSET = timedelta(0)
+
+# 体脂率 + 肌肉率超限的校验错误类型，应用层据此将该错误映射为 400
+METRIC_RATIO_ERROR_TYPE = "metric_ratio_exceeded"
+
+
+def _utcnow() -> datetime:
+    """当前 UTC 时间（字段默认值工厂）"""
+    return datetime.now(timezone.utc)
 
 
 def _ensure_timezone(value: datetime) -> datetime:
-    """确保日期时间包含时区信息"""
-    if value.tzinfo is None:
+    """确保日期时间包含时区信息
+
+    已是 UTC（含 pydantic 解析出的零偏移时区）时原样返回，不再构造新的 datetime。
+    """
+    tz = value.tzinfo
+    if tz is None:
         return value.replace(tzinfo=timezone.utc)
+    if tz is timezone.utc or tz.utcoffset(value) == _ZERO_OFFSET:
+        return value
     return value.astimezone(timezone.utc)
 
 
+def _orm_attributes(model_cls: type[BaseModel], obj: Any) -> dict[str, Any]:
+    """按输出模型的字段从 ORM 实例取值，已加载的列直接读 `__dict__`，跳过属性描述符"""
+    loaded = obj.__dict__
+    return {
+        name: loaded[name] if name in loaded else getattr(obj, name)
+        for name in model_cls.model_fields
+    }
+
+
+_TrustedModelT = TypeVar("_TrustedModelT", bound="_TrustedOrmModel")
+
+
+class _TrustedOrmModel(BaseModel):
+    """输出模型基类：提供由可信 ORM 实例直接构造、跳过校验的 `from_orm_trusted`"""
+
+    @classmethod
+    def from_orm_trusted(cls: type[_TrustedModelT], orm: Any) -> _TrustedModelT:
+        """由本服务写入/查询得到的 ORM 实例直接构造，跳过校验（仅用于可信的 DAO 返回值）"""
+        return cls.model_construct(**_orm_attributes(cls, orm))
+
+
 class HealthMetricPayload(BaseModel):
     """健康指标入参模型"""
 
@@ -52,7 +104,7 @@ class HealthMetricPayload(BaseModel):
     muscle_percent: float = Field(..., ge=10, le=80, description="肌肉率（百分比）")
     water_percent: float = Field(..., ge=20, le=80, description="水分率（百分比）")
     recorded_at: datetime = Field(
-        default_factory=lambda: datetime.now(timezone.utc),
+        default_factory=_utcnow,
         description="数据记录时间（默认当前 UTC）",
     )
     note: Optional[str] = Field(default=None, max_length=200, description="备注，可选")
@@ -62,8 +114,17 @@ class HealthMetricPayload(BaseModel):
     def validate_recorded_at(cls, value: datetime) -> datetime:
         return _ensure_timezone(value)
 
+    @model_validator(mode="after")
+    def validate_ratio(self) -> HealthMetricPayload:
+        """体脂率与肌肉率之和不得超过 100%，随模型校验一并完成"""
+        if self.body_fat_percent + self.muscle_percent > 100:
+            raise PydanticCustomError(
+                METRIC_RATIO_ERROR_TYPE, "体脂率与肌肉率之和不能超过 100%。"
+            )
+        return self
+
 
-class HealthMetricOut(BaseModel):
+class HealthMetricOut(_TrustedOrmModel):
     """健康指标输出模型"""
 
     id: int
@@ -123,7 +184,7 @@ class HealthPreferencePayload(BaseModel):
         return round(value, 1)
 
 
-class HealthPreferenceOut(BaseModel):
+class HealthPreferenceOut(_TrustedOrmModel):
     """健康偏好输出模型"""
 
     user_id: int
@@ -220,7 +281,7 @@ class AssistantMessagePayload(BaseModel):
     content: str = Field(..., min_length=1, max_length=2000, description="用户输入内容")
 
 
-class AssistantMessageOut(BaseModel):
+class AssistantMessageOut(_TrustedOrmModel):
     """历史消息输出"""
 
     id: int
@@ -238,6 +299,16 @@ class AssistantMessageOut(BaseModel):
     def ensure_change_log(cls, value: Optional[List[AgentChangeItem]]):
         return value or []
 
+    @classmethod
+    def from_orm_trusted(cls, orm: Any) -> AssistantMessageOut:
+        """由 ORM 实例直接构造，跳过校验；JSON 列中的 change_log 字典转为 `AgentChangeItem`"""
+        values = _orm_attributes(cls, orm)
+        values["change_log"] = [
+            AgentChangeItem.model_construct(**item) if isinstance(item, dict) else item
+            for item in values["change_log"] or []
+        ]
+        return cls.model_construct(**values)
+
 
 class AssistantStreamChunk(BaseModel):
     """SSE 流中的片段"""
@@ -246,3 +317,9 @@ class AssistantStreamChunk(BaseModel):
     need_change: bool = False
     change_log: List[AgentChangeItem] = Field(default_factory=list)
     is_final: bool = False
+
+
+# 列表批量校验/序列化复用的 TypeAdapter：整表在 pydantic-core 内一次完成，避免逐项进出 Python
+HealthMetricListAdapter = TypeAdapter(List[HealthMetricOut])
+AssistantMessageListAdapter = TypeAdapter(List[AssistantMessageOut])
+AgentChangeItemListAdapter = TypeAdapter(List[AgentChangeItem])
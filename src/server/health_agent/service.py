@@ -7,9 +7,12 @@
 
 公开接口：
     - `HealthService`
+    - `get_health_service`
 
 内部方法：
-    - `_validate_metric_payload`
+    - `_to_stream_chunk`
+    - `_parse_number`、`_parse_float_value`、`_parse_int_value`、`_parse_str_value`
+    - `_drop_unchanged`
 
 公开接口的 pydantic 模型：
      - `HealthMetricPayload`
@@ -24,21 +27,29 @@
 
 from __future__ import annotations
 
+import asyncio
+import math
 import re
-from typing import AsyncIterator, List
+from typing import AsyncGenerator, Callable, List, Sequence
 
-from fastapi import HTTPException, status
+from fastapi import Depends, HTTPException, status
 from loguru import logger
+from pydantic import BaseModel
 from sqlalchemy.orm import Session
 
-from .agent_client import AgentClient, AgentClientError
+from src.server.dao.dao_base import run_in_thread
+from src.server.database import get_db
+from .agent_client import AgentClient, AgentClientError, get_agent_client
+from .config import health_agent_config
 from .dao import HealthDataDAO
 from .schemas import (
     AgentChangeItem,
+    AgentChangeItemListAdapter,
     AgentChatMessage,
     AgentChatRequest,
     AgentContext,
     AgentSuggestion,
+    AssistantMessageListAdapter,
     AssistantMessageOut,
     AssistantStreamChunk,
     HealthMetricOut,
@@ -48,6 +59,76 @@ from .schemas import (
     HealthRecommendationOut,
 )
 
+_NUMERIC_PATTERN = re.compile(r"[-+]?\d*\.?\d+(?:[eE][-+]?\d+)?")
+_search_number = _NUMERIC_PATTERN.search
+# 一次 translate 同时去掉半角与全角百分号
+_PERCENT_TABLE = str.maketrans("", "", "%％")
+
+_ChangeValue = str | float | int | None
+
+
+def _parse_number(raw_value: str | float | int) -> float | None:
+    """从 change_log 文本中提取数值（容忍单位与百分号）
+
+    规整的数字文本直接 float()，只有夹带单位等杂质时才回退到正则提取。
+    """
+    text = str(raw_value).strip().translate(_PERCENT_TABLE)
+    if "_" not in text:  # float() 接受数字分隔下划线，正则路径不接受，保持原有语义
+        try:
+            return float(text)
+        except ValueError:
+            pass
+
+    match = _search_number(text)
+    if match:
+        text = match.group(0)
+
+    if not text:
+        return None
+
+    try:
+        return float(text)
+    except ValueError:
+        return None
+
+
+def _parse_float_value(raw_value: _ChangeValue) -> float | None:
+    if raw_value is None:
+        return None
+    number = _parse_number(raw_value)
+    return round(number, 2) if number is not None else None
+
+
+def _parse_int_value(raw_value: _ChangeValue) -> int | None:
+    if raw_value is None:
+        return None
+    number = _parse_number(raw_value)
+    return int(round(number)) if number is not None else None
+
+
+def _parse_str_value(raw_value: _ChangeValue) -> str | None:
+    if raw_value is None:
+        return None
+    return str(raw_value).strip()
+
+
+_VALUE_PARSERS: dict[str, Callable[[_ChangeValue], _ChangeValue]] = {
+    "float": _parse_float_value,
+    "int": _parse_int_value,
+    "str": _parse_str_value,
+}
+
+
+def _drop_unchanged(updates: dict, current: BaseModel | None) -> dict:
+    """剔除与当前值相同的字段；当前记录不存在时全部保留"""
+    if current is None:
+        return updates
+    return {
+        field: value
+        for field, value in updates.items()
+        if getattr(current, field) != value
+    }
+
 
 class HealthService:
     """健康数据与 Agent 建议业务逻辑"""
@@ -84,30 +165,39 @@ class HealthService:
         "hydration_goal": "hydration_goal_liters",
     }
 
-    _NUMERIC_PATTERN = re.compile(r"[-+]?\d*\.?\d+(?:[eE][-+]?\d+)?")
+    # 由 _FIELD_RULES 预先展开：字段 -> 解析函数，以及体测字段集合，apply_change_log 逐项只做一次查表
+    _FIELD_PARSERS = {
+        field: _VALUE_PARSERS[rule["type"]] for field, rule in _FIELD_RULES.items()
+    }
+    _METRIC_FIELDS = frozenset(
+        field for field, rule in _FIELD_RULES.items() if rule["scope"] == "metric"
+    )
 
     def __init__(self, db_session: Session):
         self.dao = HealthDataDAO(db_session)
+        # 本请求内已加载的 Agent 上下文，apply_change_log 据此定位快照中的体测并剔除未变化的字段
+        self._loaded_contexts: dict[int, AgentContext] = {}
 
     def record_metric(
         self, user_id: int, payload: HealthMetricPayload
     ) -> HealthMetricOut:
-        self._validate_metric_payload(payload)
+        # 体脂率与肌肉率之和的约束已由 HealthMetricPayload 的模型校验保证
         metric = self.dao.create_metric(user_id, payload)
-        return HealthMetricOut.model_validate(metric)
+        return HealthMetricOut.from_orm_trusted(metric)
 
     def get_latest_metric(self, user_id: int) -> HealthMetricOut | None:
-        metric = self.dao.get_latest_metric(user_id)
-        return HealthMetricOut.model_validate(metric) if metric is not None else None
+        row = self.dao.get_latest_metric(user_id)
+        return HealthMetricOut.model_construct(**row) if row is not None else None
 
     def list_metrics(self, user_id: int, limit: int = 30) -> list[HealthMetricOut]:
-        records = self.dao.list_metrics(user_id, limit)
-        return [HealthMetricOut.model_validate(item) for item in records]
+        # 数据库列已受 NOT NULL / 类型约束，读路径跳过 pydantic 校验直接构造
+        rows = self.dao.list_metrics(user_id, limit)
+        return [HealthMetricOut.model_construct(**row) for row in rows]
 
     def get_preferences(self, user_id: int) -> HealthPreferenceOut | None:
         preference = self.dao.get_preferences(user_id)
         return (
-            HealthPreferenceOut.model_validate(preference)
+            HealthPreferenceOut.from_orm_trusted(preference)
             if preference is not None
             else None
         )
@@ -116,35 +206,61 @@ class HealthService:
         self, user_id: int, payload: HealthPreferencePayload
     ) -> HealthPreferenceOut:
         preference = self.dao.upsert_preferences(user_id, payload)
-        return HealthPreferenceOut.model_validate(preference)
+        return HealthPreferenceOut.from_orm_trusted(preference)
 
     def build_agent_context(self, user_id: int) -> AgentContext:
-        metric = self.dao.get_latest_metric(user_id)
+        metric, preference = self.dao.get_latest_metric_with_preference(user_id)
         if metric is None:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail="尚未记录健康数据，请先添加体测记录。",
             )
 
-        preference = self.dao.get_preferences(user_id)
-        return AgentContext(
-            metric=HealthMetricOut.model_validate(metric),
+        context = AgentContext(
+            metric=HealthMetricOut.model_construct(**metric),
             preference=(
-                HealthPreferenceOut.model_validate(preference)
+                HealthPreferenceOut.from_orm_trusted(preference)
                 if preference is not None
                 else None
             ),
         )
+        self._loaded_contexts[user_id] = context
+        return context
+
+    def build_agent_contexts(self, user_ids: Sequence[int]) -> dict[int, AgentContext]:
+        """批量构造多个用户的 Agent 上下文
+
+        指标与偏好各一次批量查询，避免逐用户调用 `build_agent_context` 的 N+1；
+        尚无体测记录的用户不出现在结果中。
+        """
+        metrics = self.dao.list_latest_metrics(user_ids)
+        preferences = self.dao.list_preferences(list(metrics))
+        contexts: dict[int, AgentContext] = {}
+        for user_id, metric in metrics.items():
+            preference = preferences.get(user_id)
+            contexts[user_id] = AgentContext(
+                metric=HealthMetricOut.from_orm_trusted(metric),
+                preference=(
+                    HealthPreferenceOut.from_orm_trusted(preference)
+                    if preference is not None
+                    else None
+                ),
+            )
+        return contexts
 
     async def request_agent_suggestion(
         self, context: AgentContext, *, client: AgentClient | None = None
     ) -> AgentSuggestion:
-        agent_client = client or AgentClient()
+        agent_client = client or get_agent_client()
         try:
             suggestion = await agent_client.fetch_suggestion(context)
 
-            # 保存建议到数据库
-            self.dao.create_recommendation(context.metric.user_id, suggestion)
+            # 保存建议到数据库（同步 ORM 调用放到线程池，避免阻塞事件循环）
+            await run_in_thread(
+                lambda: self.dao.create_recommendation(
+                    context.metric.user_id, suggestion
+                )
+            )
 
             return suggestion
         except AgentClientError as exc:
@@ -167,23 +283,26 @@ class HealthService:
     ) -> list[AssistantMessageOut]:
         """获取 AI 助手历史对话"""
         records = self.dao.list_assistant_messages(user_id, limit)
-        return [AssistantMessageOut.model_validate(item) for item in records]
+        return AssistantMessageListAdapter.validate_python(
+            records, from_attributes=True
+        )
 
     def build_chat_history(
         self, user_id: int, limit: int = 50
     ) -> List[AgentChatMessage]:
-        """整理为 BAML 可消费的历史消息"""
-        history = []
-        for message in self.list_assistant_messages(user_id, limit):
-            history.append(
-                AgentChatMessage(
-                    role=message.role,
-                    content=message.content,
-                    need_change=message.need_change,
-                    change_log=message.change_log,
-                )
+        """整理为 BAML 可消费的历史消息
+
+        直接由 DAO 行构造 AgentChatMessage，不经过 AssistantMessageOut 中转。
+        """
+        return [
+            AgentChatMessage(
+                role=row.role,
+                content=row.content,
+                need_change=row.need_change,
+                change_log=row.change_log or [],
             )
-        return history
+            for row in self.dao.list_chat_history_rows(user_id, limit)
+        ]
 
     def compose_chat_request(
         self,
@@ -192,7 +311,8 @@ class HealthService:
         user_input: str,
     ) -> AgentChatRequest:
         """根据上下文构造聊天请求"""
-        if not user_input.strip():
+        stripped = user_input.strip()
+        if not stripped:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
                 detail="请输入有效的对话内容。",
@@ -201,9 +321,22 @@ class HealthService:
             metric=context.metric,
             preference=context.preference,
             history=history,
-            user_input=user_input.strip(),
+            user_input=stripped,
         )
 
+    def prepare_stream_chat(
+        self, user_id: int, user_input: str, *, history_limit: int = 50
+    ) -> AgentChatRequest:
+        """一次性完成流式对话前的同步准备（供路由在单次线程切换内调用）
+
+        读取上下文与历史、构造请求并保存本轮用户消息；历史在保存前读取，不含本轮输入。
+        """
+        context = self.build_agent_context(user_id)
+        history = self.build_chat_history(user_id, limit=history_limit)
+        request = self.compose_chat_request(context, history, user_input)
+        self.save_assistant_message(user_id, "user", request.user_input)
+        return request
+
     def save_assistant_message(
         self,
         user_id: int,
@@ -219,25 +352,113 @@ class HealthService:
             role=role,
             content=content,
             need_change=need_change,
-            change_log=[item.model_dump() for item in (change_log or [])],
+            change_log=(
+                AgentChangeItemListAdapter.dump_json(change_log) if change_log else None
+            ),
         )
-        return AssistantMessageOut.model_validate(record)
+        return AssistantMessageOut.from_orm_trusted(record)
+
+    def finalize_assistant_turn(
+        self, user_id: int, chunk: AssistantStreamChunk
+    ) -> None:
+        """流式对话结束后落库：保存助手回复、按需应用 change_log 并提交
+
+        三步在同一事务内完成（供路由单次线程切换调用），任一步失败整体回滚。
+        """
+        try:
+            self.save_assistant_message(
+                user_id,
+                "assistant",
+                chunk.content,
+                need_change=chunk.need_change,
+                change_log=chunk.change_log,
+            )
+            if chunk.need_change and chunk.change_log:
+                self.apply_change_log(user_id, chunk.change_log)
+            self.dao.commit()
+        except Exception:
+            self.dao.rollback()
+            raise
 
     async def stream_chat(
         self,
         request: AgentChatRequest,
         *,
         client: AgentClient | None = None,
-    ) -> AsyncIterator[AssistantStreamChunk]:
-        """调用 LLM 执行流式对话"""
-        agent_client = client or AgentClient()
-        async for chunk in agent_client.stream_chat(request):
-            yield AssistantStreamChunk(
+    ) -> AsyncGenerator[AssistantStreamChunk, None]:
+        """调用 LLM 执行流式对话
+
+        片段内容为累计全文，中间片段按 `stream_flush_interval_ms` 窗口合并：首片立即发送，
+        窗口内只保留最新一片，到期补发；最终片段立即发送并取代尚未发送的中间片段。
+        """
+        agent_client = client or get_agent_client()
+        interval = health_agent_config.stream_flush_interval_ms / 1000
+        loop = asyncio.get_running_loop()
+        upstream = agent_client.stream_chat(request)
+        pending: AgentClient.ChatStreamChunk | None = None
+        last_flush = -math.inf
+        next_chunk: asyncio.Future | None = None
+        try:
+            while True:
+                if next_chunk is None:
+                    next_chunk = asyncio.ensure_future(upstream.__anext__())
+                timeout = (
+                    None
+                    if pending is None
+                    else max(0.0, last_flush + interval - loop.time())
+                )
+                done, _ = await asyncio.wait((next_chunk,), timeout=timeout)
+                if not done:
+                    # 仅在有积压片段时才设置超时，超时返回必然存在待发送片段
+                    assert pending is not None
+                    yield self._to_stream_chunk(pending)
+                    pending, last_flush = None, loop.time()
+                    continue
+
+                try:
+                    chunk = next_chunk.result()
+                except StopAsyncIteration:
+                    break
+                finally:
+                    next_chunk = None
+
+                if chunk.is_final:
+                    pending = None
+                    yield self._to_stream_chunk(chunk)
+                elif loop.time() - last_flush >= interval:
+                    pending = None
+                    yield self._to_stream_chunk(chunk)
+                    last_flush = loop.time()
+                else:
+                    pending = chunk
+
+            if pending is not None:
+                yield self._to_stream_chunk(pending)
+        finally:
+            if next_chunk is not None:
+                next_chunk.cancel()
+                # 等待取消完成，上游生成器退出运行状态后才能 aclose
+                await asyncio.wait((next_chunk,))
+            # 客户端断开通常发生在 yield 处，此时须显式关闭上游流，不留给 GC 回收
+            await upstream.aclose()
+
+    @staticmethod
+    def _to_stream_chunk(chunk: AgentClient.ChatStreamChunk) -> AssistantStreamChunk:
+        """将 AgentClient 片段转换为对外的 SSE 片段模型"""
+        if not chunk.is_final:
+            # 中间片段字段已由 AgentClient 规整，跳过校验，仅最终片段走完整模型校验
+            return AssistantStreamChunk.model_construct(
                 content=chunk.response.content,
                 need_change=chunk.response.need_change,
                 change_log=chunk.response.change_log,
-                is_final=chunk.is_final,
+                is_final=False,
             )
+        return AssistantStreamChunk(
+            content=chunk.response.content,
+            need_change=chunk.response.need_change,
+            change_log=chunk.response.change_log,
+            is_final=True,
+        )
 
     def apply_change_log(self, user_id: int, changes: List[AgentChangeItem]) -> None:
         """根据 change_log 更新数据库"""
@@ -246,66 +467,56 @@ class HealthService:
 
         metric_updates: dict[str, float | str] = {}
         preference_updates: dict[str, float | int | str | None] = {}
+        skipped = 0
 
+        # 逐项明细只在 DEBUG 输出，循环结束后汇总一条 warning
         for item in changes:
             field_name = self._FIELD_ALIASES.get(item.field, item.field)
-            config = self._FIELD_RULES.get(field_name)
-            if config is None:
-                logger.warning("未知字段，忽略 change_log 项: {}", item.field)
+            parser = self._FIELD_PARSERS.get(field_name)
+            if parser is None:
+                skipped += 1
+                logger.debug("未知字段，忽略 change_log 项: {}", item.field)
                 continue
-            parsed_value = self._parse_change_value(config["type"], item.value)
+            parsed_value = parser(item.value)
             if parsed_value is None:
-                logger.warning("无法解析字段 {} 的值: {}", item.field, item.value)
+                skipped += 1
+                logger.debug("无法解析字段 {} 的值: {}", item.field, item.value)
                 continue
 
-            if config["scope"] == "metric":
+            if field_name in self._METRIC_FIELDS:
                 metric_updates[field_name] = parsed_value  # type: ignore[assignment]
             else:
                 preference_updates[field_name] = parsed_value
 
+        if skipped:
+            logger.warning("change_log 共 {} 项，忽略 {} 项", len(changes), skipped)
+
+        context = self._loaded_contexts.pop(user_id, None)
+        if not metric_updates and not preference_updates:
+            return
+
         if metric_updates:
             try:
-                self.dao.update_latest_metric_fields(user_id, metric_updates)
+                if context is not None:
+                    # 上下文可能早于流式输出数秒加载：只对快照中的那条体测按 id 比较并更新，
+                    # 期间新增的记录不受影响，与快照相同的修改无需写库
+                    metric_updates = _drop_unchanged(metric_updates, context.metric)
+                    if metric_updates:
+                        self.dao.update_metric_fields(
+                            user_id, context.metric.id, metric_updates
+                        )
+                else:
+                    self.dao.update_latest_metric_fields(user_id, metric_updates)
             except ValueError as exc:
                 raise HTTPException(
                     status_code=status.HTTP_400_BAD_REQUEST,
                     detail="尚未记录健康数据，无法同步 AI 修改结果。",
                 ) from exc
+        # 偏好每用户仅一行且可能在流式期间被修改，不与旧快照比较，直接 upsert
         if preference_updates:
             self.dao.apply_preference_updates(user_id, preference_updates)
 
-    def _validate_metric_payload(self, payload: HealthMetricPayload) -> None:
-        total_ratio = payload.body_fat_percent + payload.muscle_percent
-        if total_ratio > 100:
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail="体脂率与肌肉率之和不能超过 100%。",
-            )
-
-    def _parse_change_value(
-        self, value_type: str, raw_value: str | float | int | None
-    ) -> float | int | str | None:
-        """根据字段类型解析 change_log 数值"""
-        if raw_value is None:
-            return None
-
-        if value_type == "str":
-            return str(raw_value).strip()
-
-        text = str(raw_value).strip()
-        text = text.replace("%", "").replace("％", "")
-        match = self._NUMERIC_PATTERN.search(text)
-        if match:
-            text = match.group(0)
-
-        if not text:
-            return None
-
-        try:
-            number = float(text)
-        except ValueError:
-            return None
 
-        if value_type == "int":
-            return int(round(number))
-        return round(number, 2)
+def get_health_service(db: Session = Depends(get_db)) -> HealthService:
+    """FastAPI 依赖：按请求构造 HealthService，Agent 客户端沿用进程级单例"""
+    return HealthService(db)
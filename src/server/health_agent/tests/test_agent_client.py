@@ -8,18 +8,38 @@ AgentClient 模块测试
 公开接口：
     - `test_sanitize_change_items_preserves_preference_fields`
     - `test_sanitize_change_items_filters_invalid_entries`
+    - `test_fetch_suggestion_reuses_cached_result`
+    - `test_fetch_suggestion_merges_concurrent_requests`
 
 内部方法：
-    - 无。
+    - `_reset_suggestion_cache`
 
 公开接口的 pydantic 模型：
     - `AgentChangeItem`（用于断言输出结构）。
 """
 
+import asyncio
+from datetime import datetime, timezone
+
+import pytest
 from baml_client import types
 
-from src.server.health_agent.agent_client import AgentClient
-from src.server.health_agent.schemas import AgentChangeItem
+from src.server.health_agent.agent_client import AgentClient, _suggestion_cache
+from src.server.health_agent.schemas import (
+    AgentChangeItem,
+    AgentContext,
+    HealthMetricOut,
+)
+
+
+@pytest.fixture(autouse=True)
+def _reset_suggestion_cache():
+    """每个用例前后清空进程级建议缓存与进行中请求，避免用例间互相污染"""
+    _suggestion_cache.clear()
+    _suggestion_cache.inflight.clear()
+    yield
+    _suggestion_cache.clear()
+    _suggestion_cache.inflight.clear()
 
 
 def test_sanitize_change_items_preserves_preference_fields():
@@ -57,3 +77,88 @@ def test_sanitize_change_items_filters_invalid_entries():
     sanitized = AgentClient.sanitize_change_items(raw_items)
 
     assert sanitized == []
+
+
+@pytest.mark.asyncio
+async def test_fetch_suggestion_reuses_cached_result():
+    """相同指标与偏好命中缓存，不重复调用 LLM"""
+
+    class CountingBaml:
+        calls = 0
+
+        async def GenerateHealthSuggestion(self, context):
+            CountingBaml.calls += 1
+            return types.AgentSuggestion(
+                summary="保持",
+                meal_plan=["多吃蔬菜"],
+                calorie_management=[],
+                weight_management=[],
+                hydration=[],
+                lifestyle=[],
+            )
+
+    def _context(metric_id: int) -> AgentContext:
+        return AgentContext(
+            metric=HealthMetricOut(
+                id=metric_id,
+                user_id=metric_id,
+                weight_kg=81.23,
+                body_fat_percent=21.0,
+                bmi=24.1,
+                muscle_percent=41.0,
+                water_percent=56.0,
+                recorded_at=datetime.now(timezone.utc),
+                note="cache-test",
+            )
+        )
+
+    client = AgentClient(client=CountingBaml())  # type: ignore[arg-type]
+
+    first = await client.fetch_suggestion(_context(1))
+    second = await client.fetch_suggestion(_context(2))
+
+    assert CountingBaml.calls == 1
+    assert second == first
+    assert first.meal_plan == ["多吃蔬菜"]
+
+
+@pytest.mark.asyncio
+async def test_fetch_suggestion_merges_concurrent_requests():
+    """相同上下文的并发请求只触发一次 LLM 调用"""
+
+    class SlowBaml:
+        calls = 0
+
+        async def GenerateHealthSuggestion(self, context):
+            SlowBaml.calls += 1
+            await asyncio.sleep(0.05)
+            return types.AgentSuggestion(
+                summary="并发",
+                meal_plan=[],
+                calorie_management=[],
+                weight_management=[],
+                hydration=[],
+                lifestyle=[],
+            )
+
+    context = AgentContext(
+        metric=HealthMetricOut(
+            id=1,
+            user_id=1,
+            weight_kg=66.6,
+            body_fat_percent=20.0,
+            bmi=22.0,
+            muscle_percent=40.0,
+            water_percent=55.0,
+            recorded_at=datetime.now(timezone.utc),
+            note="inflight-test",
+        )
+    )
+    client = AgentClient(client=SlowBaml())  # type: ignore[arg-type]
+
+    results = await asyncio.gather(
+        *(client.fetch_suggestion(context) for _ in range(3))
+    )
+
+    assert SlowBaml.calls == 1
+    assert all(item.summary == "并发" for item in results)
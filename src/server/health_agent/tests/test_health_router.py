@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+"""
+健康 Agent 路由测试
+"""
+
+from http import HTTPStatus
+
+from src.server.health_agent import service as service_module
+from src.server.health_agent.schemas import AgentSuggestion
+
+AUTH_HEADERS = {"Authorization": "Bearer KISPACE_TEST_TOKEN"}
+
+METRIC_PAYLOAD = {
+    "weight_kg": 70.0,
+    "body_fat_percent": 18.0,
+    "bmi": 23.0,
+    "muscle_percent": 40.0,
+    "water_percent": 55.0,
+}
+
+
+def test_create_metric_rejects_ratio_over_limit(test_client, init_test_database):
+    """体脂率与肌肉率之和超过 100% 返回 400，普通字段校验错误仍为 422"""
+    resp = test_client.post(
+        "/api/health/metrics",
+        json={**METRIC_PAYLOAD, "body_fat_percent": 70.0, "muscle_percent": 40.0},
+        headers=AUTH_HEADERS,
+    )
+    assert resp.status_code == HTTPStatus.BAD_REQUEST
+    assert "不能超过 100%" in resp.json()["detail"]
+
+    resp = test_client.post(
+        "/api/health/metrics",
+        json={**METRIC_PAYLOAD, "weight_kg": -1},
+        headers=AUTH_HEADERS,
+    )
+    assert resp.status_code == HTTPStatus.UNPROCESSABLE_ENTITY
+
+
+def test_latest_metric_etag_revalidation(test_client, init_test_database):
+    """最新体测携带 ETag，内容未变返回 304，新增记录后 ETag 变化"""
+    resp = test_client.post(
+        "/api/health/metrics", json=METRIC_PAYLOAD, headers=AUTH_HEADERS
+    )
+    assert resp.status_code == HTTPStatus.CREATED, resp.text
+
+    resp = test_client.get("/api/health/metrics/latest", headers=AUTH_HEADERS)
+    assert resp.status_code == HTTPStatus.OK
+    assert resp.json()["weight_kg"] == 70.0
+    etag = resp.headers["etag"]
+
+    cached = test_client.get(
+        "/api/health/metrics/latest",
+        headers={**AUTH_HEADERS, "If-None-Match": etag},
+    )
+    assert cached.status_code == HTTPStatus.NOT_MODIFIED
+    assert cached.content == b""
+
+    test_client.post(
+        "/api/health/metrics",
+        json={**METRIC_PAYLOAD, "weight_kg": 69.0},
+        headers=AUTH_HEADERS,
+    )
+    refreshed = test_client.get(
+        "/api/health/metrics/latest",
+        headers={**AUTH_HEADERS, "If-None-Match": etag},
+    )
+    assert refreshed.status_code == HTTPStatus.OK
+    assert refreshed.json()["weight_kg"] == 69.0
+    assert refreshed.headers["etag"] != etag
+
+
+def test_preferences_etag_revalidation(test_client, init_test_database):
+    """偏好更新后旧 ETag 失效"""
+    resp = test_client.get("/api/health/preferences", headers=AUTH_HEADERS)
+    assert resp.status_code == HTTPStatus.OK
+    etag = resp.headers["etag"]
+
+    cached = test_client.get(
+        "/api/health/preferences", headers={**AUTH_HEADERS, "If-None-Match": etag}
+    )
+    assert cached.status_code == HTTPStatus.NOT_MODIFIED
+
+    test_client.put(
+        "/api/health/preferences",
+        json={"sleep_goal_hours": 8},
+        headers=AUTH_HEADERS,
+    )
+    updated = test_client.get(
+        "/api/health/preferences", headers={**AUTH_HEADERS, "If-None-Match": etag}
+    )
+    assert updated.status_code == HTTPStatus.OK
+    assert updated.json()["sleep_goal_hours"] == 8
+
+
+def test_generate_recommendation_persists_before_response(
+    test_client, init_test_database, monkeypatch
+):
+    """生成建议的请求内即完成落库，随后的 latest 查询可读到完整记录"""
+    suggestion = AgentSuggestion(summary="保持现状即可", hydration=["每日饮水 2.5 升"])
+
+    class StubClient:
+        async def fetch_suggestion(self, context):
+            return suggestion
+
+    monkeypatch.setattr(service_module, "get_agent_client", lambda: StubClient())
+    test_client.post("/api/health/metrics", json=METRIC_PAYLOAD, headers=AUTH_HEADERS)
+
+    resp = test_client.post("/api/health/recommendations", headers=AUTH_HEADERS)
+    assert resp.status_code == HTTPStatus.OK
+    assert resp.json()["summary"] == "保持现状即可"
+
+    latest = test_client.get("/api/health/recommendations/latest", headers=AUTH_HEADERS)
+    assert latest.status_code == HTTPStatus.OK
+    assert latest.json()["hydration"] == ["每日饮水 2.5 升"]
@@ -3,11 +3,15 @@
 健康 Agent 服务层测试
 """
 
+import asyncio
+
 import pytest
 from fastapi import HTTPException
+from pydantic import ValidationError
 from sqlalchemy.orm import Session
 
 import src.server.health_agent.models  # noqa: F401
+from src.server.health_agent.models import HealthPreference
 from src.server.health_agent.agent_client import AgentClient, AgentClientError
 from src.server.health_agent.schemas import (
     AgentChangeItem,
@@ -16,6 +20,7 @@ from src.server.health_agent.schemas import (
     AssistantStreamChunk,
     HealthMetricPayload,
     HealthPreferencePayload,
+    METRIC_RATIO_ERROR_TYPE,
 )
 from src.server.health_agent.service import HealthService
 
@@ -43,14 +48,11 @@ def test_record_metric_and_validation(test_db_session: Session):
     assert result.weight_kg == pytest.approx(70.0)
     assert result.body_fat_percent == pytest.approx(18.0)
 
-    with pytest.raises(HTTPException) as exc_info:
-        service.record_metric(
-            user_id=1,
-            payload=_build_payload(body_fat_percent=70.0, muscle_percent=40.0),
-        )
+    with pytest.raises(ValidationError) as exc_info:
+        _build_payload(body_fat_percent=70.0, muscle_percent=40.0)
 
-    assert exc_info.value.status_code == 400
-    assert "不能超过 100%" in exc_info.value.detail
+    assert exc_info.value.errors()[0]["type"] == METRIC_RATIO_ERROR_TYPE
+    assert "不能超过 100%" in str(exc_info.value)
 
 
 def test_preferences_roundtrip(test_db_session: Session):
@@ -75,6 +77,46 @@ def test_preferences_roundtrip(test_db_session: Session):
     assert fetched.calorie_budget_kcal == 2000
 
 
+def test_preferences_upsert_overwrites_existing_row(test_db_session: Session):
+    """重复写入偏好时更新同一条记录，局部更新保留其它字段"""
+    service = HealthService(test_db_session)
+    service.update_preferences(
+        user_id=3,
+        payload=HealthPreferencePayload(calorie_budget_kcal=1800, sleep_goal_hours=8),
+    )
+    updated = service.update_preferences(
+        user_id=3, payload=HealthPreferencePayload(calorie_budget_kcal=2200)
+    )
+    assert updated.calorie_budget_kcal == 2200
+    assert updated.sleep_goal_hours is None
+
+    service.dao.apply_preference_updates(3, {"activity_level": "active"})
+    fetched = service.get_preferences(user_id=3)
+    assert fetched is not None
+    assert fetched.calorie_budget_kcal == 2200
+    assert fetched.activity_level == "active"
+    assert test_db_session.query(HealthPreference).filter_by(user_id=3).count() == 1
+
+
+def test_preferences_upsert_falls_back_without_on_conflict(
+    test_db_session: Session, monkeypatch: pytest.MonkeyPatch
+):
+    """不支持 ON CONFLICT 的方言走先查后写，新增与覆盖均生效"""
+    monkeypatch.setattr(test_db_session.get_bind().dialect, "name", "other")
+    service = HealthService(test_db_session)
+
+    service.update_preferences(
+        user_id=16, payload=HealthPreferencePayload(sleep_goal_hours=7)
+    )
+    updated = service.update_preferences(
+        user_id=16, payload=HealthPreferencePayload(hydration_goal_liters=2.5)
+    )
+
+    assert updated.sleep_goal_hours is None
+    assert updated.hydration_goal_liters == pytest.approx(2.5)
+    assert test_db_session.query(HealthPreference).filter_by(user_id=16).count() == 1
+
+
 def test_build_agent_context_without_metric(test_db_session: Session):
     """没有体测数据时提示用户先录入"""
     service = HealthService(test_db_session)
@@ -85,6 +127,44 @@ def test_build_agent_context_without_metric(test_db_session: Session):
     assert exc_info.value.status_code == 404
 
 
+def test_build_agent_context_loads_metric_and_preference(test_db_session: Session):
+    """单用户上下文取最新体测，并带上偏好（无偏好时为 None）"""
+    service = HealthService(test_db_session)
+    service.record_metric(user_id=14, payload=_build_payload(weight_kg=70.0))
+    service.record_metric(user_id=14, payload=_build_payload(weight_kg=68.0))
+
+    context = service.build_agent_context(user_id=14)
+    assert context.metric.weight_kg == pytest.approx(68.0)
+    assert context.preference is None
+
+    service.update_preferences(
+        user_id=14, payload=HealthPreferencePayload(hydration_goal_liters=2.5)
+    )
+    context = service.build_agent_context(user_id=14)
+    assert context.metric.user_id == 14
+    assert context.preference is not None
+    assert context.preference.hydration_goal_liters == pytest.approx(2.5)
+
+
+def test_build_agent_contexts_batches_users(test_db_session: Session):
+    """批量构造上下文：每个用户取最新体测，缺少体测的用户被跳过"""
+    service = HealthService(test_db_session)
+    service.record_metric(user_id=11, payload=_build_payload(weight_kg=70.0))
+    service.record_metric(user_id=11, payload=_build_payload(weight_kg=68.0))
+    service.record_metric(user_id=12, payload=_build_payload(weight_kg=80.0))
+    service.update_preferences(
+        user_id=12, payload=HealthPreferencePayload(sleep_goal_hours=8)
+    )
+
+    contexts = service.build_agent_contexts([11, 12, 13])
+
+    assert set(contexts) == {11, 12}
+    assert contexts[11].metric.weight_kg == pytest.approx(68.0)
+    assert contexts[11].preference is None
+    assert contexts[12].preference is not None
+    assert contexts[12].preference.sleep_goal_hours == pytest.approx(8)
+
+
 @pytest.mark.asyncio
 async def test_request_agent_suggestion_success(test_db_session: Session):
     """验证 Agent 返回的建议结构"""
@@ -152,19 +232,72 @@ def test_apply_change_log_updates_data(test_db_session: Session):
     assert preference.hydration_goal_liters == pytest.approx(2.8)
 
 
+def test_apply_change_log_skips_unchanged_fields(
+    test_db_session: Session, monkeypatch: pytest.MonkeyPatch
+):
+    """与已加载上下文相同的修改不写库"""
+    service = HealthService(test_db_session)
+    service.record_metric(user_id=8, payload=_build_payload(water_percent=55.0))
+    service.build_agent_context(user_id=8)
+
+    def _fail(*args, **kwargs):
+        raise AssertionError("不应发出 UPDATE")
+
+    monkeypatch.setattr(service.dao, "update_metric_fields", _fail)
+    monkeypatch.setattr(service.dao, "update_latest_metric_fields", _fail)
+    service.apply_change_log(
+        user_id=8,
+        changes=[AgentChangeItem(field="water_percent", value="55%", reason=None)],
+    )
+
+
+def test_apply_change_log_targets_loaded_snapshot(test_db_session: Session):
+    """加载上下文后出现的新体测与偏好修改不会导致 change_log 被误判为无变化"""
+    service = HealthService(test_db_session)
+    service.record_metric(user_id=15, payload=_build_payload(water_percent=55.0))
+    service.update_preferences(
+        user_id=15, payload=HealthPreferencePayload(hydration_goal_liters=2.0)
+    )
+    context = service.build_agent_context(user_id=15)
+
+    # 模拟流式输出期间其他请求新增体测并修改偏好
+    service.record_metric(user_id=15, payload=_build_payload(water_percent=50.0))
+    service.update_preferences(
+        user_id=15, payload=HealthPreferencePayload(hydration_goal_liters=3.0)
+    )
+
+    service.apply_change_log(
+        user_id=15,
+        changes=[
+            AgentChangeItem(field="water_percent", value="58", reason=None),
+            AgentChangeItem(field="hydration_goal_liters", value="2.0", reason=None),
+        ],
+    )
+
+    metrics = service.list_metrics(user_id=15)
+    by_id = {metric.id: metric.water_percent for metric in metrics}
+    assert by_id[context.metric.id] == pytest.approx(58.0)
+    assert sorted(by_id.values()) == pytest.approx([50.0, 58.0])
+    preference = service.get_preferences(user_id=15)
+    assert preference is not None
+    assert preference.hydration_goal_liters == pytest.approx(2.0)
+
+
 def test_save_and_list_assistant_messages(test_db_session: Session):
     """对话消息可写入并读取"""
     service = HealthService(test_db_session)
     service.record_metric(user_id=7, payload=_build_payload())
 
     service.save_assistant_message(user_id=7, role="user", content="你好")
-    service.save_assistant_message(
+    saved = service.save_assistant_message(
         user_id=7,
         role="assistant",
         content="你好，我是 AI",
         need_change=True,
         change_log=[AgentChangeItem(field="note", value="加油", reason=None)],
     )
+    assert isinstance(saved.change_log[0], AgentChangeItem)
+    assert saved.change_log[0].value == "加油"
 
     history = service.list_assistant_messages(user_id=7)
     assert len(history) == 2
@@ -185,7 +318,9 @@ async def test_stream_chat_yields_chunks(test_db_session: Session):
         AgentChatResponse(
             content="已完成，记得多喝水",
             need_change=True,
-            change_log=[AgentChangeItem(field="water_percent", value="58", reason="新目标")],
+            change_log=[
+                AgentChangeItem(field="water_percent", value="58", reason="新目标")
+            ],
         ),
     ]
 
@@ -204,3 +339,59 @@ async def test_stream_chat_yields_chunks(test_db_session: Session):
     assert len(chunks) == 2
     assert chunks[-1].is_final is True
     assert chunks[-1].need_change is True
+
+
+@pytest.mark.asyncio
+async def test_stream_chat_coalesces_partial_chunks(test_db_session: Session):
+    """验证窗口内连续到达的中间片段只发送最新一片，停顿时补发积压片段"""
+    service = HealthService(test_db_session)
+    service.record_metric(user_id=9, payload=_build_payload())
+    context = service.build_agent_context(user_id=9)
+    request = service.compose_chat_request(context, history=[], user_input="你好")
+
+    class StreamStub:
+        async def stream_chat(self, request):
+            for text in ("你", "你好", "你好，"):
+                yield AgentClient.ChatStreamChunk(
+                    response=AgentChatResponse(content=text), is_final=False
+                )
+            await asyncio.sleep(0.1)
+            yield AgentClient.ChatStreamChunk(
+                response=AgentChatResponse(content="你好，今天"), is_final=True
+            )
+
+    chunks = [
+        chunk
+        async for chunk in service.stream_chat(request, client=StreamStub())  # type: ignore[arg-type]
+    ]
+
+    assert [chunk.content for chunk in chunks] == ["你", "你好，", "你好，今天"]
+    assert [chunk.is_final for chunk in chunks] == [False, False, True]
+
+
+@pytest.mark.asyncio
+async def test_stream_chat_closes_upstream_on_early_exit(test_db_session: Session):
+    """下游提前关闭（如客户端断开）时上游流随之关闭"""
+    service = HealthService(test_db_session)
+    service.record_metric(user_id=10, payload=_build_payload())
+    context = service.build_agent_context(user_id=10)
+    request = service.compose_chat_request(context, history=[], user_input="你好")
+    closed = []
+
+    class StreamStub:
+        async def stream_chat(self, request):
+            try:
+                while True:
+                    yield AgentClient.ChatStreamChunk(
+                        response=AgentChatResponse(content="处理中"), is_final=False
+                    )
+                    await asyncio.sleep(0)
+            finally:
+                closed.append(True)
+
+    stream = service.stream_chat(request, client=StreamStub())  # type: ignore[arg-type]
+    first = await stream.__anext__()
+    await stream.aclose()
+
+    assert first.content == "处理中"
+    assert closed == [True]
@@ -5,24 +5,32 @@ FastAPI 应用主入口。
 负责应用的生命周期管理、中间件配置、API路由挂载以及前端SPA的集成。
 """
 
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
 from contextlib import asynccontextmanager
 from pathlib import Path
 
-from fastapi import FastAPI, Request
+from fastapi import FastAPI, Request, status
+from fastapi.exception_handlers import request_validation_exception_handler
+from fastapi.exceptions import RequestValidationError
+from fastapi.routing import APIRoute
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse, Response
+from fastapi.responses import FileResponse, JSONResponse, Response
 from fastapi.staticfiles import StaticFiles
 from loguru import logger
 from starlette.middleware.base import BaseHTTPMiddleware
 from starlette.types import Scope
 
 from src.server.config import global_config
-from src.server.database import get_database_info, init_database
+from src.server.dao.dao_base import run_in_thread
+from src.server.database import get_database_info, init_database, ping_database
 
 # 路由模块
 from src.server.auth.router import router as auth_router
 from src.server.example_module.router import router as example_router
+from src.server.health_agent.agent_client import close_agent_client
 from src.server.health_agent.router import router as health_router
+from src.server.health_agent.schemas import METRIC_RATIO_ERROR_TYPE
 
 # --- 配置与常量 ---
 PROJECT_ROOT = Path(global_config.project_root)
@@ -37,8 +45,14 @@ async def lifespan(_: FastAPI):
     """
     应用生命周期管理：
     - 启动时检查并按需初始化数据库。
+    - 为同步 ORM 调用配置固定大小的默认线程池。
+    - 关闭时刷新 BAML 追踪并释放共享的 AgentClient。
     """
     logger.info("应用启动中...")
+    executor = ThreadPoolExecutor(
+        max_workers=global_config.db_thread_workers, thread_name_prefix="db"
+    )
+    asyncio.get_running_loop().set_default_executor(executor)
     db_info = get_database_info()
     if not db_info.database_exists:
         logger.warning("数据库不存在，正在执行初始化...")
@@ -49,6 +63,9 @@ async def lifespan(_: FastAPI):
 
     logger.success("应用启动完成。")
     yield
+    # 追踪刷新可能涉及网络 IO，放到线程池执行，须在线程池关闭前完成
+    await run_in_thread(close_agent_client)
+    executor.shutdown(wait=False)
     logger.info("应用已关闭。")
 
 
@@ -98,6 +115,18 @@ class CacheControlMiddleware(BaseHTTPMiddleware):
 app.add_middleware(CacheControlMiddleware)
 
 
+@app.exception_handler(RequestValidationError)
+async def validation_exception_handler(request: Request, exc: RequestValidationError):
+    """体测比例超限属于业务规则错误，沿用 400 响应；其余校验错误保持默认的 422"""
+    for error in exc.errors():
+        if error.get("type") == METRIC_RATIO_ERROR_TYPE:
+            return JSONResponse(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                content={"detail": error["msg"]},
+            )
+    return await request_validation_exception_handler(request, exc)
+
+
 # --- API 路由 ---
 # API 路由建议统一使用 /api 前缀，以避免与前端路由冲突
 @app.get("/api/health", summary="健康检查", tags=["系统"])
@@ -106,10 +135,32 @@ def health():
     return {"status": "ok"}
 
 
+@app.get("/api/healthz", summary="数据库就绪检查", tags=["系统"])
+async def healthz():
+    """执行 `SELECT 1` 确认数据库可用，同时预热连接池。"""
+    try:
+        await run_in_thread(ping_database)
+    except Exception as exc:
+        logger.error(f"数据库就绪检查失败：{exc}")
+        return JSONResponse(
+            status_code=503, content={"status": "error", "database": "unavailable"}
+        )
+    return {"status": "ok", "database": "ok"}
+
+
 app.include_router(auth_router)
 app.include_router(example_router)
 app.include_router(health_router)
 
+# 同一 (方法, 路径) 只允许注册一次，避免重复挂载路由导致匹配时遍历冗余条目
+_route_keys = [
+    (method, route.path)
+    for route in app.routes
+    if isinstance(route, APIRoute)
+    for method in route.methods
+]
+assert len(set(_route_keys)) == len(_route_keys), "检测到重复注册的 API 路由"
+
 
 # --- 前端 SPA 静态文件服务 ---
 class SPAStaticFiles(StaticFiles):